@@ -0,0 +1,554 @@
+"""ASGI variant of the RAAH-SETU API.
+
+Serves the same endpoints as ``api_enhanced.py`` with the same validation, SQL
+and response bodies (all shared through ``api_common``), but on asyncio with an
+aiomysql pool. A request waiting on MySQL or on a slow client costs a
+coroutine rather than a thread, so one process can hold thousands of
+concurrent connections, e.g. phones on poor networks sending SOS.
+
+Run from the Backend folder:
+
+    python -m uvicorn api_async:app --host 127.0.0.1 --port 5000
+"""
+import asyncio
+import json
+
+import aiomysql
+import pymysql
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api_common import (
+    DB_CONFIG, USER_EXISTS_SQL, USER_INSERT, USER_LOGIN_SQL, CONTACTS_SQL, CONTACT_INSERT,
+    CONTACT_OWNER_SQL, CONTACT_UPDATE, CONTACT_DELETE, HEALTH_CHECK_INSERT, INCIDENT_INSERT,
+    ACTIVITY_INSERT, SOS_INSERT, SUMMARY_SQL, HEALTH_CHECK_HISTORY, INCIDENT_HISTORY,
+    ACTIVITY_HISTORY, STREAM_CHUNK_ROWS, STREAM_FORMATS, BadPageRequest, BadBatchRequest,
+    signup_values, login_values, contact_values, contact_update_values, health_check_values,
+    incident_values, activity_values, sos_values, history_query, history_page_query, split_page,
+    stream_params, parse_batch, validate_batch, fill_batch_ids, multi_row_insert, batch_payload,
+    summary_bump_query, summary_health_check_query, summary_health_check_queries,
+    summary_payload, contacts_cache_key
+)
+from async_db_pool import AsyncConnectionPool
+from cache import ReadThroughCache
+from db_pool import ConnectionPool, PoolError, PoolTimeout
+import metrics
+from password_hashing import HashPoolBusy, PasswordHasher
+from sos_dispatch import SOSDispatcher
+
+# Request handlers share one asyncio pool (DB_POOL_* settings as in api_enhanced.py)
+db_pool = AsyncConnectionPool.from_env(DB_CONFIG)
+password_hasher = PasswordHasher.from_env()
+contacts_cache = ReadThroughCache.from_env("CONTACTS")
+# SOS fan-out runs on background threads, so it keeps a small blocking pool of its own
+sos_dispatcher = SOSDispatcher.from_env(ConnectionPool(DB_CONFIG, size=4, name="sos"))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await db_pool.open()
+    try:
+        # Finish fan-out for alerts that were committed but not fully notified before a restart
+        await asyncio.to_thread(sos_dispatcher.recover_pending)
+    except PoolError as e:
+        print(f"Could not recover pending SOS alerts: {e}")
+    yield
+    sos_dispatcher.shutdown(wait=False)
+    password_hasher.shutdown()
+    await db_pool.close()
+
+
+app = FastAPI(title="RAAH-SETU API (async)", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+# Request latency, status counts and pool wait for every route, served at /api/metrics
+metrics.install_asgi(app)
+metrics.register_pool("main", db_pool)
+
+
+def respond(payload, status_code=200):
+    return JSONResponse(jsonable_encoder(payload), status_code=status_code)
+
+
+def error(message, status_code):
+    return respond({'error': message}, status_code)
+
+
+def db_unavailable(e):
+    print(f"Database connection error: {e}")
+    if isinstance(e, PoolTimeout):
+        return JSONResponse({'error': 'Database busy, please retry'}, status_code=503, headers={'Retry-After': '1'})
+    return error('Database connection failed', 500)
+
+
+def hashing_busy(e):
+    return JSONResponse({'error': 'Too many sign-in requests, please retry'}, status_code=503,
+                        headers={'Retry-After': str(e.retry_after)})
+
+
+async def summary_bump(cursor, user_id, column, delta=1):
+    await cursor.execute(*summary_bump_query(user_id, column, delta))
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """StreamingResponse that runs ``on_close()`` once it has been sent, failed or abandoned,
+    whether or not the body iterator ever started."""
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+
+def stream_rows(conn, cursor, key, fmt):
+    """Stream rows from an executed SSDictCursor; the connection goes back to the pool at the end."""
+    state = {'finished': False}
+
+    async def generate():
+        if fmt == 'json':
+            yield '{' + json.dumps(key) + ': ['
+        first = True
+        while True:
+            rows = await cursor.fetchmany(STREAM_CHUNK_ROWS)
+            if not rows:
+                break
+            encoded = [json.dumps(jsonable_encoder(row)) for row in rows]
+            if fmt == 'json':
+                chunk = ', '.join(encoded)
+                yield chunk if first else ', ' + chunk
+                first = False
+            else:
+                yield ''.join(line + '\n' for line in encoded)
+        if fmt == 'json':
+            yield ']}'
+        await cursor.close()
+        state['finished'] = True
+
+    async def release():
+        # Released by the response rather than the generator, which never runs if the client is
+        # gone before the body starts. A client that went away mid-stream leaves unread rows;
+        # drop that connection.
+        await db_pool.release(conn, broken=not state['finished'])
+
+    return ReleasingStreamingResponse(generate(), release, media_type=STREAM_FORMATS[fmt])
+
+
+async def list_history(request, history):
+    table, columns, key = history
+    try:
+        user_id = request.query_params.get('user_id')
+
+        if not user_id:
+            return error('User ID required', 400)
+
+        if 'stream' in request.query_params:
+            fmt, after = stream_params(request.query_params)
+            sql, params = history_query(table, columns, user_id, after)
+            conn = await db_pool.acquire()
+            try:
+                cursor = await conn.cursor(aiomysql.SSDictCursor)
+                await cursor.execute(sql, params)
+            except BaseException:
+                await db_pool.release(conn, broken=True)
+                raise
+            return stream_rows(conn, cursor, key, fmt)
+
+        sql, params, limit = history_page_query(table, columns, user_id, request.query_params)
+        async with db_pool.connection() as conn, conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            rows, next_cursor = split_page(await cursor.fetchall(), limit)
+
+        return respond({key: rows, 'next_cursor': next_cursor})
+
+    except BadPageRequest as e:
+        return error(str(e), 400)
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def insert_batch(request, validate, insert_sql, after_insert=None):
+    try:
+        records = parse_batch(request.headers.get('content-type', '').split(';')[0].strip(), await request.body())
+        results, rows, positions = validate_batch(records, validate)
+
+        if rows:
+            async with db_pool.connection() as conn, conn.cursor() as cursor:
+                await cursor.execute(*multi_row_insert(insert_sql, rows))
+                first_id = cursor.lastrowid
+                if after_insert:
+                    await after_insert(cursor, rows)
+                await conn.commit()
+            fill_batch_ids(results, positions, first_id)
+
+        payload, status = batch_payload(results, len(rows))
+        return respond(payload, status)
+
+    except BadBatchRequest as e:
+        return error(str(e), 400)
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+# ==================== AUTHENTICATION ENDPOINTS ====================
+
+@app.post('/api/auth/signup')
+async def signup(request: Request):
+    """User registration endpoint"""
+    try:
+        err, values = signup_values(await request.json())
+        if err:
+            return error(err, 400)
+        name, email, phone, password = values
+
+        # Check if user already exists
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(USER_EXISTS_SQL, (email,))
+            if await cursor.fetchone():
+                return error('Email already registered', 409)
+
+        # Hash password without holding a database connection
+        hashed_password = await password_hasher.hash_async(password)
+
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(USER_INSERT, (name, email, phone, hashed_password))
+            await conn.commit()
+            user_id = cursor.lastrowid
+
+        return respond({
+            'message': 'User registered successfully',
+            'user_id': user_id,
+            'email': email
+        }, 201)
+
+    except pymysql.err.IntegrityError:
+        # Lost a race with a concurrent signup for the same email
+        return error('Email already registered', 409)
+    except HashPoolBusy as e:
+        return hashing_busy(e)
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@app.post('/api/auth/login')
+async def login(request: Request):
+    """User login endpoint"""
+    try:
+        err, values = login_values(await request.json())
+        if err:
+            return error(err, 400)
+        email, password = values
+
+        async with db_pool.connection() as conn, conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(USER_LOGIN_SQL, (email,))
+            user = await cursor.fetchone()
+
+        if not user or not await password_hasher.verify_async(password, user['password']):
+            return error('Invalid credentials', 401)
+
+        return respond({
+            'message': 'Login successful',
+            'user_id': user['id'],
+            'name': user['name'],
+            'email': user['email']
+        })
+
+    except HashPoolBusy as e:
+        return hashing_busy(e)
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+# ==================== EMERGENCY CONTACTS ENDPOINTS ====================
+
+async def load_emergency_contacts(user_id):
+    async with db_pool.connection() as conn, conn.cursor(aiomysql.DictCursor) as cursor:
+        await cursor.execute(CONTACTS_SQL, (user_id,))
+        return await cursor.fetchall()
+
+
+@app.get('/api/emergency-contacts')
+async def get_emergency_contacts(request: Request):
+    """Get all emergency contacts for a user"""
+    try:
+        user_id = request.query_params.get('user_id')
+
+        if not user_id:
+            return error('User ID required', 400)
+
+        contacts = await contacts_cache.get_or_load_async(
+            contacts_cache_key(user_id), lambda: load_emergency_contacts(user_id)
+        )
+
+        return respond({'contacts': contacts})
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@app.post('/api/emergency-contacts')
+async def create_emergency_contact(request: Request):
+    """Create a new emergency contact"""
+    try:
+        err, values = contact_values(await request.json())
+        if err:
+            return error(err, 400)
+        user_id = values[0]
+
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(CONTACT_INSERT, values)
+            contact_id = cursor.lastrowid
+            await summary_bump(cursor, user_id, 'contact_count')
+            await conn.commit()
+
+        contacts_cache.invalidate(contacts_cache_key(user_id))
+
+        return respond({
+            'message': 'Emergency contact created',
+            'contact_id': contact_id
+        }, 201)
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@app.put('/api/emergency-contacts/{contact_id}')
+async def update_emergency_contact(contact_id: int, request: Request):
+    """Update an emergency contact"""
+    try:
+        _, values = contact_update_values(await request.json(), contact_id)
+
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(CONTACT_OWNER_SQL, (contact_id,))
+            owner = await cursor.fetchone()
+            if not owner:
+                return error('Contact not found', 404)
+
+            await cursor.execute(CONTACT_UPDATE, values)
+            await conn.commit()
+
+        contacts_cache.invalidate(contacts_cache_key(owner[0]))
+
+        return respond({'message': 'Contact updated successfully'})
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@app.delete('/api/emergency-contacts/{contact_id}')
+async def delete_emergency_contact(contact_id: int):
+    """Delete an emergency contact"""
+    try:
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(CONTACT_OWNER_SQL + " FOR UPDATE", (contact_id,))
+            owner = await cursor.fetchone()
+            if not owner:
+                return error('Contact not found', 404)
+
+            await cursor.execute(CONTACT_DELETE, (contact_id,))
+            await summary_bump(cursor, owner[0], 'contact_count', -1)
+            await conn.commit()
+
+        contacts_cache.invalidate(contacts_cache_key(owner[0]))
+
+        return respond({'message': 'Contact deleted successfully'})
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+# ==================== HEALTH CHECK ENDPOINTS ====================
+
+async def summarize_health_checks(cursor, rows):
+    for sql, params in summary_health_check_queries(rows):
+        await cursor.execute(sql, params)
+
+
+@app.get('/api/health-checks')
+async def get_health_checks(request: Request):
+    """Get health checks for a user"""
+    return await list_history(request, HEALTH_CHECK_HISTORY)
+
+
+@app.post('/api/health-checks')
+async def create_health_check(request: Request):
+    """Create a new health check"""
+    try:
+        err, values = health_check_values(await request.json())
+        if err:
+            return error(err, 400)
+
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(HEALTH_CHECK_INSERT, values)
+            check_id = cursor.lastrowid
+            await cursor.execute(*summary_health_check_query(values[0], values[1], values[2], values[5]))
+            await conn.commit()
+
+        return respond({
+            'message': 'Health check recorded',
+            'check_id': check_id
+        }, 201)
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@app.post('/api/health-checks/batch')
+async def create_health_checks_batch(request: Request):
+    """Record many health checks (JSON array or NDJSON) in one transaction"""
+    return await insert_batch(request, health_check_values, HEALTH_CHECK_INSERT, summarize_health_checks)
+
+# ==================== INCIDENT REPORT ENDPOINTS ====================
+
+@app.get('/api/incidents')
+async def get_incidents(request: Request):
+    """Get incidents for a user"""
+    return await list_history(request, INCIDENT_HISTORY)
+
+
+@app.post('/api/incidents')
+async def create_incident(request: Request):
+    """Create a new incident report"""
+    try:
+        err, values = incident_values(await request.json())
+        if err:
+            return error(err, 400)
+
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(INCIDENT_INSERT, values)
+            incident_id = cursor.lastrowid
+            await summary_bump(cursor, values[0], 'incidents_reported')
+            await conn.commit()
+
+        return respond({
+            'message': 'Incident reported',
+            'incident_id': incident_id
+        }, 201)
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+# ==================== ACTIVITY LOG ENDPOINTS ====================
+
+@app.get('/api/activities')
+async def get_activities(request: Request):
+    """Get activities for a user"""
+    return await list_history(request, ACTIVITY_HISTORY)
+
+
+@app.post('/api/activities')
+async def create_activity(request: Request):
+    """Log a new activity"""
+    try:
+        err, values = activity_values(await request.json())
+        if err:
+            return error(err, 400)
+
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(ACTIVITY_INSERT, values)
+            await conn.commit()
+
+        return respond({'message': 'Activity logged'}, 201)
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+@app.post('/api/activities/batch')
+async def create_activities_batch(request: Request):
+    """Log many activities (JSON array or NDJSON) in one transaction"""
+    return await insert_batch(request, activity_values, ACTIVITY_INSERT)
+
+# ==================== SOS ENDPOINT ====================
+
+@app.post('/api/sos/activate')
+async def activate_sos(request: Request):
+    """Activate SOS alert"""
+    try:
+        err, values = sos_values(await request.json())
+        if err:
+            return error(err, 400)
+        user_id, location = values
+
+        async with db_pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(SOS_INSERT, values)
+            sos_id = cursor.lastrowid
+            await summary_bump(cursor, user_id, 'active_sos_count')
+            await conn.commit()
+
+        # The alert is durable now; fan-out runs on the dispatcher's threads
+        sos_dispatcher.dispatch(sos_id, user_id, location)
+
+        return respond({
+            'message': 'SOS activated',
+            'sos_id': sos_id
+        }, 201)
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+# ==================== USER SUMMARY ENDPOINT ====================
+
+@app.get('/api/summary')
+async def get_summary(request: Request):
+    """Get a user's dashboard summary"""
+    try:
+        user_id = request.query_params.get('user_id')
+
+        if not user_id:
+            return error('User ID required', 400)
+
+        async with db_pool.connection() as conn, conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(SUMMARY_SQL, (user_id,))
+            row = await cursor.fetchone()
+
+        return respond({'summary': summary_payload(row)})
+
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+# ==================== HEALTH CHECK ====================
+
+@app.get('/api/health')
+async def health_check():
+    """API health check"""
+    return respond({
+        'status': 'ok',
+        'message': 'RAAH-SETU API is running',
+        'version': '2.0',
+        'mode': 'asgi',
+        'db_pool': db_pool.stats(),
+        'hash_pool': password_hasher.stats(),
+        'contacts_cache': contacts_cache.stats(),
+        'sos_dispatch': sos_dispatcher.stats()
+    })
@@ -0,0 +1,373 @@
+"""Validation, SQL and payload helpers shared by the RAAH-SETU API servers.
+
+``api_enhanced.py`` (Flask, threads) and ``api_async.py`` (ASGI, asyncio) expose
+the same endpoints. Everything that does not depend on the web framework or
+on how the database is driven lives here, so both servers accept the same
+input, run the same SQL and answer with the same JSON.
+
+Validators return ``(error, values)``: ``error`` is the message for a 400
+response, otherwise ``values`` is the parameter tuple for the matching INSERT.
+Query builders return ``(sql, params)`` for ``cursor.execute``.
+"""
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+
+# MySQL Database Configuration
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "database": os.getenv("DB_NAME", "raah_setu")
+}
+
+# ==================== SQL ====================
+
+USER_EXISTS_SQL = "SELECT id FROM users WHERE email = %s"
+USER_INSERT = "INSERT INTO users (name, email, phone, password, created_at) VALUES (%s, %s, %s, %s, NOW())"
+USER_LOGIN_SQL = "SELECT id, name, email, password FROM users WHERE email = %s"
+
+CONTACTS_SQL = (
+    "SELECT id, name, phone, relationship, priority, email FROM emergency_contacts "
+    "WHERE user_id = %s ORDER BY priority DESC"
+)
+CONTACT_INSERT = (
+    "INSERT INTO emergency_contacts (user_id, name, phone, relationship, priority, email, created_at) "
+    "VALUES (%s, %s, %s, %s, %s, %s, NOW())"
+)
+CONTACT_OWNER_SQL = "SELECT user_id FROM emergency_contacts WHERE id = %s"
+CONTACT_UPDATE = (
+    "UPDATE emergency_contacts SET name = %s, phone = %s, relationship = %s, priority = %s, email = %s "
+    "WHERE id = %s"
+)
+CONTACT_DELETE = "DELETE FROM emergency_contacts WHERE id = %s"
+
+HEALTH_CHECK_INSERT = (
+    "INSERT INTO health_checks (user_id, mood, heart_rate, location, notes, created_at) "
+    "VALUES (%s, %s, %s, %s, %s, COALESCE(%s, NOW()))"
+)
+INCIDENT_INSERT = (
+    "INSERT INTO incidents (user_id, title, description, type, severity, location, status, created_at) "
+    "VALUES (%s, %s, %s, %s, %s, %s, 'reported', NOW())"
+)
+ACTIVITY_INSERT = (
+    "INSERT INTO activities (user_id, activity_type, description, location, created_at) "
+    "VALUES (%s, %s, %s, %s, COALESCE(%s, NOW()))"
+)
+SOS_INSERT = "INSERT INTO sos_alerts (user_id, location, status, created_at) VALUES (%s, %s, 'active', NOW())"
+
+SUMMARY_SQL = (
+    "SELECT incidents_reported, incidents_in_progress, incidents_resolved, latest_mood, latest_heart_rate, "
+    "latest_health_check_at, active_sos_count, contact_count FROM user_summary WHERE user_id = %s"
+)
+
+# History listings: table, selected columns and the response key
+HEALTH_CHECK_HISTORY = ("health_checks", "id, mood, heart_rate, location, notes, created_at", "checks")
+INCIDENT_HISTORY = ("incidents", "id, title, description, type, severity, location, status, created_at", "incidents")
+ACTIVITY_HISTORY = ("activities", "id, activity_type, description, location, created_at", "activities")
+
+# ==================== VALIDATION ====================
+
+# Helper function to read an optional client-side timestamp (ISO 8601)
+def parse_created_at(value):
+    if value in (None, ''):
+        return None
+    return datetime.fromisoformat(str(value))
+
+def signup_values(data):
+    name = data.get('name')
+    email = data.get('email')
+    phone = data.get('phone')
+    password = data.get('password')
+
+    if not all([name, email, phone, password]):
+        return 'All fields are required', None
+    return None, (name, email, phone, password)
+
+def login_values(data):
+    email = data.get('email')
+    password = data.get('password')
+
+    if not email or not password:
+        return 'Email and password required', None
+    return None, (email, password)
+
+def contact_values(data):
+    user_id = data.get('user_id')
+    name = data.get('name')
+    phone = data.get('phone')
+    relationship = data.get('relationship')
+    priority = data.get('priority', 'medium')
+    email = data.get('email', '')
+
+    if not all([user_id, name, phone, relationship]):
+        return 'Required fields missing', None
+    return None, (user_id, name, phone, relationship, priority, email)
+
+def contact_update_values(data, contact_id):
+    return None, (data.get('name'), data.get('phone'), data.get('relationship'),
+                  data.get('priority'), data.get('email'), contact_id)
+
+def health_check_values(data):
+    user_id = data.get('user_id')
+    mood = data.get('mood')
+    heart_rate = data.get('heart_rate')
+    location = data.get('location', '')
+    notes = data.get('notes', '')
+
+    if not all([user_id, mood]):
+        return 'User ID and mood required', None
+    try:
+        created_at = parse_created_at(data.get('created_at'))
+    except ValueError:
+        return 'Invalid created_at', None
+    return None, (user_id, mood, heart_rate, location, notes, created_at)
+
+def incident_values(data):
+    user_id = data.get('user_id')
+    title = data.get('title')
+    description = data.get('description')
+    incident_type = data.get('type')
+    severity = data.get('severity', 'medium')
+    location = data.get('location')
+
+    if not all([user_id, title, description, incident_type, location]):
+        return 'Required fields missing', None
+    return None, (user_id, title, description, incident_type, severity, location)
+
+def activity_values(data):
+    user_id = data.get('user_id')
+    activity_type = data.get('type')
+    description = data.get('description')
+    location = data.get('location', '')
+
+    if not all([user_id, activity_type, description]):
+        return 'Required fields missing', None
+    try:
+        created_at = parse_created_at(data.get('created_at'))
+    except ValueError:
+        return 'Invalid created_at', None
+    return None, (user_id, activity_type, description, location, created_at)
+
+def sos_values(data):
+    user_id = data.get('user_id')
+    location = data.get('location')
+
+    if not user_id:
+        return 'User ID required', None
+    return None, (user_id, location)
+
+# ==================== PAGINATION ====================
+
+# History pagination limits; override with PAGE_DEFAULT_LIMIT / PAGE_MAX_LIMIT
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "200"))
+
+# Rows fetched per round trip when streaming; override with STREAM_CHUNK_ROWS
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "500"))
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+class BadPageRequest(ValueError):
+    """Raised for an invalid limit, cursor or stream query parameter."""
+
+# Helper function to build an opaque cursor from the last row of a page
+def encode_cursor(row):
+    raw = json.dumps([row['created_at'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+# Helper function to read a cursor back into (created_at, id)
+def decode_cursor(token):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, ValueError, TypeError, UnicodeError):
+        raise BadPageRequest('Invalid cursor')
+
+# Helper function to read limit/cursor from the query string
+def page_params(args):
+    try:
+        limit = int(args.get('limit', PAGE_DEFAULT_LIMIT))
+    except ValueError:
+        raise BadPageRequest('limit must be an integer')
+    if limit < 1:
+        raise BadPageRequest('limit must be positive')
+    token = args.get('cursor')
+    return min(limit, PAGE_MAX_LIMIT), decode_cursor(token) if token else None
+
+# Helper function to read ?stream= and the optional starting cursor
+def stream_params(args):
+    fmt = args.get('stream')
+    if fmt not in STREAM_FORMATS:
+        raise BadPageRequest('stream must be json or ndjson')
+    token = args.get('cursor')
+    return fmt, decode_cursor(token) if token else None
+
+# Helper function to build a newest-first history query.
+# Uses keyset pagination on (created_at, id), so every page is an index range
+# scan no matter how deep the client has paged.
+def history_query(table, columns, user_id, after=None, limit=None):
+    sql = f"SELECT {columns} FROM {table} WHERE user_id = %s"
+    params = [user_id]
+    if after:
+        sql += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+# Helper function to build the query for one page; it fetches one extra row to
+# learn whether another page exists (see split_page)
+def history_page_query(table, columns, user_id, args):
+    limit, after = page_params(args)
+    sql, params = history_query(table, columns, user_id, after, limit + 1)
+    return sql, params, limit
+
+# Helper function to trim the extra row and compute next_cursor
+def split_page(rows, limit):
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+# ==================== BATCH INGESTION ====================
+
+# Largest batch accepted by the bulk ingestion endpoints; override with BATCH_MAX_RECORDS
+BATCH_MAX_RECORDS = int(os.getenv("BATCH_MAX_RECORDS", "1000"))
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+INVALID_JSON_LINE = object()
+
+class BadBatchRequest(ValueError):
+    """Raised when a batch body is malformed, empty or too large."""
+
+# Helper function to read a batch body: a JSON array, or NDJSON with one object per line
+def parse_batch(mimetype, body):
+    text = body.decode('utf-8', errors='replace') if isinstance(body, bytes) else body
+    if mimetype in NDJSON_MIMETYPES:
+        records = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Reported against this record instead of failing the whole batch
+                records.append(INVALID_JSON_LINE)
+    else:
+        try:
+            records = json.loads(text)
+        except ValueError:
+            records = None
+        if not isinstance(records, list):
+            raise BadBatchRequest('Body must be a JSON array or NDJSON')
+    if not records:
+        raise BadBatchRequest('Batch is empty')
+    if len(records) > BATCH_MAX_RECORDS:
+        raise BadBatchRequest(f'Batch exceeds {BATCH_MAX_RECORDS} records')
+    return records
+
+# Helper function to validate a batch; returns per-record results (errors filled in),
+# the insert rows of the valid records and their positions in the request
+def validate_batch(records, validate):
+    results = [None] * len(records)
+    rows = []
+    positions = []
+    for i, record in enumerate(records):
+        if record is INVALID_JSON_LINE:
+            results[i] = {'index': i, 'error': 'Invalid JSON'}
+            continue
+        if not isinstance(record, dict):
+            results[i] = {'index': i, 'error': 'Record must be a JSON object'}
+            continue
+        error, values = validate(record)
+        if error:
+            results[i] = {'index': i, 'error': error}
+            continue
+        rows.append(values)
+        positions.append(i)
+    return results, rows, positions
+
+# Helper function to turn a single-row INSERT ... VALUES (...) into one multi-row INSERT
+# for rows. The drivers' executemany() only does this for plain %s placeholders, and the
+# batch inserts use expressions such as COALESCE(%s, NOW()), so it is done here.
+def multi_row_insert(insert_sql, rows):
+    head, sep, values = insert_sql.rpartition(' VALUES ')
+    if not sep:
+        raise ValueError('INSERT statement has no VALUES clause')
+    sql = head + sep + ', '.join([values] * len(rows))
+    return sql, [value for row in rows for value in row]
+
+# Helper function to record the ids of an inserted batch. A multi-row INSERT (see
+# multi_row_insert) assigns consecutive AUTO_INCREMENT ids starting at the cursor's lastrowid.
+def fill_batch_ids(results, positions, first_id):
+    for offset, i in enumerate(positions):
+        results[i] = {'index': i, 'id': first_id + offset}
+
+# Helper function to build a batch response body and status
+def batch_payload(results, inserted):
+    return {
+        'message': 'Batch processed',
+        'inserted': inserted,
+        'failed': len(results) - inserted,
+        'results': results
+    }, 201 if inserted else 400
+
+# ==================== USER SUMMARY ====================
+
+# user_summary holds one row of dashboard counters per user. Write paths update it
+# in the same transaction as their insert, so GET /api/summary is one primary-key
+# lookup instead of several scans (see create_schema.rebuild_user_summary).
+SUMMARY_COUNTERS = ('incidents_reported', 'incidents_in_progress', 'incidents_resolved',
+                    'active_sos_count', 'contact_count')
+
+# Query to add delta to one user_summary counter (never below zero)
+def summary_bump_query(user_id, column, delta=1):
+    if column not in SUMMARY_COUNTERS:
+        raise ValueError(f'Unknown summary counter: {column}')
+    sql = (f"INSERT INTO user_summary (user_id, {column}) VALUES (%s, GREATEST(%s, 0)) "
+           f"ON DUPLICATE KEY UPDATE {column} = GREATEST({column} + %s, 0)")
+    return sql, (user_id, delta, delta)
+
+# Query to record a health check as the latest one unless a newer one is known
+def summary_health_check_query(user_id, mood, heart_rate, created_at=None):
+    newer = "(latest_health_check_at IS NULL OR VALUES(latest_health_check_at) >= latest_health_check_at)"
+    sql = ("INSERT INTO user_summary (user_id, latest_mood, latest_heart_rate, latest_health_check_at) "
+           "VALUES (%s, %s, %s, COALESCE(%s, NOW())) "
+           f"ON DUPLICATE KEY UPDATE latest_mood = IF({newer}, VALUES(latest_mood), latest_mood), "
+           f"latest_heart_rate = IF({newer}, VALUES(latest_heart_rate), latest_heart_rate), "
+           f"latest_health_check_at = IF({newer}, VALUES(latest_health_check_at), latest_health_check_at)")
+    return sql, (user_id, mood, heart_rate, created_at)
+
+# Summary queries for a batch of health check rows. Only the newest reading per
+# user matters, so this is one upsert per user rather than one per row.
+def summary_health_check_queries(rows):
+    latest = {}
+    for row in rows:
+        user_id, created_at = row[0], row[5]
+        current = latest.get(user_id)
+        # Rows without a client timestamp are stamped NOW() and so are the newest
+        if current is None or current[5] is not None and (created_at is None or created_at >= current[5]):
+            latest[user_id] = row
+    return [summary_health_check_query(user_id, mood, heart_rate, created_at)
+            for user_id, mood, heart_rate, _, _, created_at in latest.values()]
+
+# Helper function to shape a user_summary row (or None) for the response
+def summary_payload(row):
+    # Users with no writes yet have no summary row
+    row = row or dict.fromkeys(SUMMARY_COUNTERS, 0)
+    return {
+        'incidents': {
+            'reported': row['incidents_reported'],
+            'in_progress': row['incidents_in_progress'],
+            'resolved': row['incidents_resolved']
+        },
+        'latest_mood': row.get('latest_mood'),
+        'latest_heart_rate': row.get('latest_heart_rate'),
+        'latest_health_check_at': row.get('latest_health_check_at'),
+        'active_sos_count': row['active_sos_count'],
+        'contact_count': row['contact_count']
+    }
+
+def contacts_cache_key(user_id):
+    return f"contacts:{user_id}"
@@ -1,39 +1,173 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import mysql.connector
-from mysql.connector import Error
-import json
-from datetime import datetime
-import bcrypt
 import os
+from contextlib import closing
+
+from api_common import (
+    DB_CONFIG, USER_EXISTS_SQL, USER_INSERT, USER_LOGIN_SQL, CONTACTS_SQL, CONTACT_INSERT,
+    CONTACT_OWNER_SQL, CONTACT_UPDATE, CONTACT_DELETE, HEALTH_CHECK_INSERT, INCIDENT_INSERT,
+    ACTIVITY_INSERT, SOS_INSERT, SUMMARY_SQL, HEALTH_CHECK_HISTORY, INCIDENT_HISTORY,
+    ACTIVITY_HISTORY, STREAM_CHUNK_ROWS, STREAM_FORMATS, BadPageRequest, BadBatchRequest,
+    signup_values, login_values, contact_values, contact_update_values, health_check_values,
+    incident_values, activity_values, sos_values, history_query, history_page_query, split_page,
+    stream_params, parse_batch, validate_batch, fill_batch_ids, multi_row_insert, batch_payload,
+    summary_bump_query, summary_health_check_query, summary_health_check_queries,
+    summary_payload, contacts_cache_key
+)
+from cache import ReadThroughCache
+from db_pool import ConnectionPool, PoolError, PoolTimeout
+import metrics
+from password_hashing import HashPoolBusy, PasswordHasher
+from sos_dispatch import SOSDispatcher
 
 app = Flask(__name__)
 CORS(app)
 
-# MySQL Database Configuration
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER", "root"),
-    "password": os.getenv("DB_PASSWORD", ""),
-    "database": os.getenv("DB_NAME", "raah_setu")
-}
+# Shared connection pool; sized with DB_POOL_SIZE / DB_POOL_TIMEOUT / DB_POOL_MAX_LIFETIME
+db_pool = ConnectionPool.from_env(DB_CONFIG)
 
-# Helper function to get database connection
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except Error as e:
-        print(f"Database connection error: {e}")
-        return None
+# Request latency, status counts and DB timing for every route, served at /api/metrics
+metrics.install_flask(app)
+metrics.register_pool("main", db_pool)
+
+# Helper function to turn pool failures into a response
+def db_unavailable(e):
+    print(f"Database connection error: {e}")
+    if isinstance(e, PoolTimeout):
+        response = jsonify({'error': 'Database busy, please retry'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return jsonify({'error': 'Database connection failed'}), 500
+
+# bcrypt runs in its own process pool; sized with BCRYPT_WORKERS / BCRYPT_MAX_PENDING
+password_hasher = PasswordHasher.from_env()
 
 # Helper function to hash password
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return password_hasher.hash(password)
 
 # Helper function to verify password
 def verify_password(password, hashed):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return password_hasher.verify(password, hashed)
+
+# Helper function to shed auth load when the bcrypt pool is saturated
+def hashing_busy(e):
+    response = jsonify({'error': 'Too many sign-in requests, please retry'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+# Helper function to fetch one page of a user's history
+def fetch_history_page(cursor, history, user_id, args):
+    table, columns, _ = history
+    sql, params, limit = history_page_query(table, columns, user_id, args)
+    cursor.execute(sql, params)
+    return split_page(cursor.fetchall(), limit)
+
+# Helper function to stream a query result without materializing it.
+# Rows are read with fetchmany() from an unbuffered cursor, so MySQL sends them
+# as we write them out and memory stays flat however long the history is.
+# 'json' keeps the regular {key: [...]} document shape; 'ndjson' writes one row per line.
+def stream_rows(sql, params, key, fmt):
+    pooled = db_pool.acquire()
+    try:
+        cursor = pooled.conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(sql, params)
+    except BaseException:
+        db_pool.release(pooled, broken=True)
+        raise
+
+    state = {'finished': False, 'released': False}
+    dumps = app.json.dumps
+
+    def generate():
+        if fmt == 'json':
+            yield '{' + dumps(key) + ': ['
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_CHUNK_ROWS)
+            if not rows:
+                break
+            if fmt == 'json':
+                chunk = ', '.join(dumps(row) for row in rows)
+                yield chunk if first else ', ' + chunk
+                first = False
+            else:
+                yield ''.join(dumps(row) + '\n' for row in rows)
+        if fmt == 'json':
+            yield ']}'
+        cursor.close()
+        state['finished'] = True
+
+    def release():
+        # Runs when the response is closed, including client disconnects mid-stream
+        if not state['released']:
+            state['released'] = True
+            db_pool.release(pooled, broken=not state['finished'])
+
+    response = Response(generate(), mimetype=STREAM_FORMATS[fmt])
+    response.call_on_close(release)
+    return response
+
+# Helper function to serve a user's full history as a stream (?stream=json|ndjson)
+def stream_history(history, user_id, args):
+    table, columns, key = history
+    fmt, after = stream_params(args)
+    sql, params = history_query(table, columns, user_id, after)
+    return stream_rows(sql, params, key, fmt)
+
+# Helper function to list a user's history: one page, or a stream with ?stream=
+def list_history(history):
+    try:
+        user_id = request.args.get('user_id')
+
+        if not user_id:
+            return jsonify({'error': 'User ID required'}), 400
+
+        if 'stream' in request.args:
+            return stream_history(history, user_id, request.args)
+
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            rows, next_cursor = fetch_history_page(cursor, history, user_id, request.args)
+
+        return jsonify({history[2]: rows, 'next_cursor': next_cursor}), 200
+
+    except BadPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Helper function to validate a batch and insert the valid records in one transaction.
+# after_insert(cursor, rows) runs inside the same transaction.
+def insert_batch(validate, insert_sql, after_insert=None):
+    try:
+        records = parse_batch(request.mimetype, request.get_data())
+        results, rows, positions = validate_batch(records, validate)
+
+        if rows:
+            with db_pool.connection() as conn, closing(conn.cursor()) as cursor:
+                cursor.execute(*multi_row_insert(insert_sql, rows))
+                first_id = cursor.lastrowid
+                if after_insert:
+                    after_insert(cursor, rows)
+                conn.commit()
+            fill_batch_ids(results, positions, first_id)
+
+        payload, status = batch_payload(results, len(rows))
+        return jsonify(payload), status
+
+    except BadBatchRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Helper function to add delta to one user_summary counter
+def summary_bump(cursor, user_id, column, delta=1):
+    cursor.execute(*summary_bump_query(user_id, column, delta))
 
 # ==================== AUTHENTICATION ENDPOINTS ====================
 
@@ -41,41 +175,25 @@ def verify_password(password, hashed):
 def signup():
     """User registration endpoint"""
     try:
-        data = request.json
-        name = data.get('name')
-        email = data.get('email')
-        phone = data.get('phone')
-        password = data.get('password')
-
-        if not all([name, email, phone, password]):
-            return jsonify({'error': 'All fields are required'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
+        error, values = signup_values(request.json)
+        if error:
+            return jsonify({'error': error}), 400
+        name, email, phone, password = values
 
         # Check if user already exists
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Email already registered'}), 409
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(USER_EXISTS_SQL, (email,))
+            if cursor.fetchone():
+                return jsonify({'error': 'Email already registered'}), 409
 
-        # Hash password
+        # Hash password without holding a database connection
         hashed_password = hash_password(password)
 
-        # Insert user
-        cursor.execute(
-            "INSERT INTO users (name, email, phone, password, created_at) VALUES (%s, %s, %s, %s, NOW())",
-            (name, email, phone, hashed_password)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            # Insert user
+            cursor.execute(USER_INSERT, (name, email, phone, hashed_password))
+            conn.commit()
+            user_id = cursor.lastrowid
 
         return jsonify({
             'message': 'User registered successfully',
@@ -83,6 +201,13 @@ def signup():
             'email': email
         }), 201
 
+    except mysql.connector.IntegrityError:
+        # Lost a race with a concurrent signup for the same email
+        return jsonify({'error': 'Email already registered'}), 409
+    except HashPoolBusy as e:
+        return hashing_busy(e)
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -90,25 +215,15 @@ def signup():
 def login():
     """User login endpoint"""
     try:
-        data = request.json
-        email = data.get('email')
-        password = data.get('password')
-
-        if not email or not password:
-            return jsonify({'error': 'Email and password required'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
+        error, values = login_values(request.json)
+        if error:
+            return jsonify({'error': error}), 400
+        email, password = values
 
-        cursor = conn.cursor(dictionary=True)
-
-        # Get user
-        cursor.execute("SELECT id, name, email, password FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            # Get user
+            cursor.execute(USER_LOGIN_SQL, (email,))
+            user = cursor.fetchone()
 
         if not user or not verify_password(password, user['password']):
             return jsonify({'error': 'Invalid credentials'}), 401
@@ -120,36 +235,42 @@ def login():
             'email': user['email']
         }), 200
 
+    except HashPoolBusy as e:
+        return hashing_busy(e)
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ==================== EMERGENCY CONTACTS ENDPOINTS ====================
 
+# Per-user read-through cache; configure with CONTACTS_CACHE_BACKEND (memory|redis),
+# CONTACTS_CACHE_URL, CONTACTS_CACHE_TTL and CONTACTS_CACHE_SIZE
+contacts_cache = ReadThroughCache.from_env("CONTACTS")
+
+# Helper function to load a user's contacts from MySQL (cache miss path)
+def load_emergency_contacts(user_id):
+    with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+        cursor.execute(CONTACTS_SQL, (user_id,))
+        return cursor.fetchall()
+
 @app.route('/api/emergency-contacts', methods=['GET'])
 def get_emergency_contacts():
     """Get all emergency contacts for a user"""
     try:
         user_id = request.args.get('user_id')
-        
+
         if not user_id:
             return jsonify({'error': 'User ID required'}), 400
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, name, phone, relationship, priority, email FROM emergency_contacts WHERE user_id = %s ORDER BY priority DESC",
-            (user_id,)
+        contacts = contacts_cache.get_or_load(
+            contacts_cache_key(user_id), lambda: load_emergency_contacts(user_id)
         )
-        contacts = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
 
         return jsonify({'contacts': contacts}), 200
 
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -157,37 +278,26 @@ def get_emergency_contacts():
 def create_emergency_contact():
     """Create a new emergency contact"""
     try:
-        data = request.json
-        user_id = data.get('user_id')
-        name = data.get('name')
-        phone = data.get('phone')
-        relationship = data.get('relationship')
-        priority = data.get('priority', 'medium')
-        email = data.get('email', '')
-
-        if not all([user_id, name, phone, relationship]):
-            return jsonify({'error': 'Required fields missing'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "INSERT INTO emergency_contacts (user_id, name, phone, relationship, priority, email, created_at) VALUES (%s, %s, %s, %s, %s, %s, NOW())",
-            (user_id, name, phone, relationship, priority, email)
-        )
-        conn.commit()
-        contact_id = cursor.lastrowid
+        error, values = contact_values(request.json)
+        if error:
+            return jsonify({'error': error}), 400
+        user_id = values[0]
 
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(CONTACT_INSERT, values)
+            contact_id = cursor.lastrowid
+            summary_bump(cursor, user_id, 'contact_count')
+            conn.commit()
+
+        contacts_cache.invalidate(contacts_cache_key(user_id))
 
         return jsonify({
             'message': 'Emergency contact created',
             'contact_id': contact_id
         }), 201
 
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -195,34 +305,23 @@ def create_emergency_contact():
 def update_emergency_contact(contact_id):
     """Update an emergency contact"""
     try:
-        data = request.json
-        name = data.get('name')
-        phone = data.get('phone')
-        relationship = data.get('relationship')
-        priority = data.get('priority')
-        email = data.get('email')
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE emergency_contacts SET name = %s, phone = %s, relationship = %s, priority = %s, email = %s WHERE id = %s",
-            (name, phone, relationship, priority, email, contact_id)
-        )
-        conn.commit()
+        _, values = contact_update_values(request.json, contact_id)
 
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Contact not found'}), 404
+        with db_pool.connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(CONTACT_OWNER_SQL, (contact_id,))
+            owner = cursor.fetchone()
+            if not owner:
+                return jsonify({'error': 'Contact not found'}), 404
 
-        cursor.close()
-        conn.close()
+            cursor.execute(CONTACT_UPDATE, values)
+            conn.commit()
+
+        contacts_cache.invalidate(contacts_cache_key(owner[0]))
 
         return jsonify({'message': 'Contact updated successfully'}), 200
 
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -230,159 +329,94 @@ def update_emergency_contact(contact_id):
 def delete_emergency_contact(contact_id):
     """Delete an emergency contact"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM emergency_contacts WHERE id = %s", (contact_id,))
-        conn.commit()
+        with db_pool.connection() as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(CONTACT_OWNER_SQL + " FOR UPDATE", (contact_id,))
+            owner = cursor.fetchone()
+            if not owner:
+                return jsonify({'error': 'Contact not found'}), 404
 
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Contact not found'}), 404
+            cursor.execute(CONTACT_DELETE, (contact_id,))
+            summary_bump(cursor, owner[0], 'contact_count', -1)
+            conn.commit()
 
-        cursor.close()
-        conn.close()
+        contacts_cache.invalidate(contacts_cache_key(owner[0]))
 
         return jsonify({'message': 'Contact deleted successfully'}), 200
 
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ==================== HEALTH CHECK ENDPOINTS ====================
 
+# Helper function to update user_summary after a batch of health checks
+def summarize_health_checks(cursor, rows):
+    for sql, params in summary_health_check_queries(rows):
+        cursor.execute(sql, params)
+
 @app.route('/api/health-checks', methods=['GET'])
 def get_health_checks():
     """Get health checks for a user"""
-    try:
-        user_id = request.args.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'User ID required'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, mood, heart_rate, location, notes, created_at FROM health_checks WHERE user_id = %s ORDER BY created_at DESC",
-            (user_id,)
-        )
-        checks = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        return jsonify({'checks': checks}), 200
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return list_history(HEALTH_CHECK_HISTORY)
 
 @app.route('/api/health-checks', methods=['POST'])
 def create_health_check():
     """Create a new health check"""
     try:
-        data = request.json
-        user_id = data.get('user_id')
-        mood = data.get('mood')
-        heart_rate = data.get('heart_rate')
-        location = data.get('location', '')
-        notes = data.get('notes', '')
-
-        if not all([user_id, mood]):
-            return jsonify({'error': 'User ID and mood required'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "INSERT INTO health_checks (user_id, mood, heart_rate, location, notes, created_at) VALUES (%s, %s, %s, %s, %s, NOW())",
-            (user_id, mood, heart_rate, location, notes)
-        )
-        conn.commit()
-        check_id = cursor.lastrowid
+        error, values = health_check_values(request.json)
+        if error:
+            return jsonify({'error': error}), 400
 
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(HEALTH_CHECK_INSERT, values)
+            check_id = cursor.lastrowid
+            cursor.execute(*summary_health_check_query(values[0], values[1], values[2], values[5]))
+            conn.commit()
 
         return jsonify({
             'message': 'Health check recorded',
             'check_id': check_id
         }), 201
 
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/health-checks/batch', methods=['POST'])
+def create_health_checks_batch():
+    """Record many health checks (JSON array or NDJSON) in one transaction"""
+    return insert_batch(health_check_values, HEALTH_CHECK_INSERT, summarize_health_checks)
+
 # ==================== INCIDENT REPORT ENDPOINTS ====================
 
 @app.route('/api/incidents', methods=['GET'])
 def get_incidents():
     """Get incidents for a user"""
-    try:
-        user_id = request.args.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'User ID required'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, title, description, type, severity, location, status, created_at FROM incidents WHERE user_id = %s ORDER BY created_at DESC",
-            (user_id,)
-        )
-        incidents = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        return jsonify({'incidents': incidents}), 200
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return list_history(INCIDENT_HISTORY)
 
 @app.route('/api/incidents', methods=['POST'])
 def create_incident():
     """Create a new incident report"""
     try:
-        data = request.json
-        user_id = data.get('user_id')
-        title = data.get('title')
-        description = data.get('description')
-        incident_type = data.get('type')
-        severity = data.get('severity', 'medium')
-        location = data.get('location')
-
-        if not all([user_id, title, description, incident_type, location]):
-            return jsonify({'error': 'Required fields missing'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "INSERT INTO incidents (user_id, title, description, type, severity, location, status, created_at) VALUES (%s, %s, %s, %s, %s, %s, 'reported', NOW())",
-            (user_id, title, description, incident_type, severity, location)
-        )
-        conn.commit()
-        incident_id = cursor.lastrowid
+        error, values = incident_values(request.json)
+        if error:
+            return jsonify({'error': error}), 400
 
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(INCIDENT_INSERT, values)
+            incident_id = cursor.lastrowid
+            summary_bump(cursor, values[0], 'incidents_reported')
+            conn.commit()
 
         return jsonify({
             'message': 'Incident reported',
             'incident_id': incident_id
         }), 201
 
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -391,96 +425,84 @@ def create_incident():
 @app.route('/api/activities', methods=['GET'])
 def get_activities():
     """Get activities for a user"""
-    try:
-        user_id = request.args.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'User ID required'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, activity_type, description, location, created_at FROM activities WHERE user_id = %s ORDER BY created_at DESC",
-            (user_id,)
-        )
-        activities = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        return jsonify({'activities': activities}), 200
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return list_history(ACTIVITY_HISTORY)
 
 @app.route('/api/activities', methods=['POST'])
 def create_activity():
     """Log a new activity"""
     try:
-        data = request.json
-        user_id = data.get('user_id')
-        activity_type = data.get('type')
-        description = data.get('description')
-        location = data.get('location', '')
-
-        if not all([user_id, activity_type, description]):
-            return jsonify({'error': 'Required fields missing'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "INSERT INTO activities (user_id, activity_type, description, location, created_at) VALUES (%s, %s, %s, %s, NOW())",
-            (user_id, activity_type, description, location)
-        )
-        conn.commit()
+        error, values = activity_values(request.json)
+        if error:
+            return jsonify({'error': error}), 400
 
-        cursor.close()
-        conn.close()
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(ACTIVITY_INSERT, values)
+            conn.commit()
 
         return jsonify({'message': 'Activity logged'}), 201
 
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/activities/batch', methods=['POST'])
+def create_activities_batch():
+    """Log many activities (JSON array or NDJSON) in one transaction"""
+    return insert_batch(activity_values, ACTIVITY_INSERT)
+
 # ==================== SOS ENDPOINT ====================
 
+# Notifies contacts and guardians in the background; senders chosen with SOS_SENDERS
+sos_dispatcher = SOSDispatcher.from_env(db_pool)
+
 @app.route('/api/sos/activate', methods=['POST'])
 def activate_sos():
     """Activate SOS alert"""
     try:
-        data = request.json
-        user_id = data.get('user_id')
-        location = data.get('location')
-
-        if not user_id:
-            return jsonify({'error': 'User ID required'}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
+        error, values = sos_values(request.json)
+        if error:
+            return jsonify({'error': error}), 400
+        user_id, location = values
 
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "INSERT INTO sos_alerts (user_id, location, status, created_at) VALUES (%s, %s, 'active', NOW())",
-            (user_id, location)
-        )
-        conn.commit()
-        sos_id = cursor.lastrowid
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(SOS_INSERT, values)
+            sos_id = cursor.lastrowid
+            summary_bump(cursor, user_id, 'active_sos_count')
+            conn.commit()
 
-        cursor.close()
-        conn.close()
+        # The alert is durable now; fan-out runs off the request thread
+        sos_dispatcher.dispatch(sos_id, user_id, location)
 
         return jsonify({
             'message': 'SOS activated',
             'sos_id': sos_id
         }), 201
 
+    except PoolError as e:
+        return db_unavailable(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== USER SUMMARY ENDPOINT ====================
+
+@app.route('/api/summary', methods=['GET'])
+def get_summary():
+    """Get a user's dashboard summary"""
+    try:
+        user_id = request.args.get('user_id')
+
+        if not user_id:
+            return jsonify({'error': 'User ID required'}), 400
+
+        with db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(SUMMARY_SQL, (user_id,))
+            row = cursor.fetchone()
+
+        return jsonify({'summary': summary_payload(row)}), 200
+
+    except PoolError as e:
+        return db_unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -492,8 +514,20 @@ def health_check():
     return jsonify({
         'status': 'ok',
         'message': 'RAAH-SETU API is running',
-        'version': '2.0'
+        'version': '2.0',
+        'db_pool': db_pool.stats(),
+        'hash_pool': password_hasher.stats(),
+        'contacts_cache': contacts_cache.stats(),
+        'sos_dispatch': sos_dispatcher.stats()
     }), 200
 
 if __name__ == '__main__':
-    app.run(debug=True, host='127.0.0.1', port=5000)
+    debug = True
+    # Finish fan-out for alerts that were committed but not fully notified before a restart.
+    # With the reloader this module runs twice; only the child that serves requests recovers.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        try:
+            sos_dispatcher.recover_pending()
+        except PoolError as e:
+            print(f"Could not recover pending SOS alerts: {e}")
+    app.run(debug=debug, host='127.0.0.1', port=5000)
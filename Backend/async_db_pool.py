@@ -0,0 +1,139 @@
+"""Asyncio MySQL connection pool for the ASGI server (api_async.py).
+
+Wraps an aiomysql pool with the same behaviour and counters as
+``db_pool.ConnectionPool``: bounded size, borrow timeout (raising
+``PoolTimeout``), optional ping-on-borrow, max-lifetime recycling and rollback
+of unfinished transactions on release.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+import pymysql
+
+from db_pool import PoolError, PoolTimeout
+from metrics import observe_pool_wait
+
+
+class AsyncConnectionPool:
+    def __init__(self, db_config, size=10, timeout=5.0, max_lifetime=1800.0, validate=True, name="main"):
+        self.db_config = dict(db_config)
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.validate = validate
+        self._pool = None
+
+        self._in_use = 0
+        self._invalidated = 0
+        self._borrows = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, db_config):
+        """Build a pool sized by the DB_POOL_* environment variables."""
+        return cls(
+            db_config,
+            size=int(os.getenv("DB_POOL_SIZE", "10")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+            max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            validate=os.getenv("DB_POOL_VALIDATE", "true").lower() in ("1", "true", "yes"),
+        )
+
+    async def open(self):
+        config = self.db_config
+        self._pool = await aiomysql.create_pool(
+            host=config["host"],
+            user=config["user"],
+            password=config["password"],
+            db=config["database"],
+            minsize=0,
+            maxsize=self.size,
+            pool_recycle=int(self.max_lifetime) if self.max_lifetime else -1,
+            autocommit=False,
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    async def acquire(self):
+        """Borrow a connection, waiting up to ``timeout`` seconds for a free one."""
+        if self._pool is None:
+            raise PoolError("database pool is not open")
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            try:
+                conn = await asyncio.wait_for(self._pool.acquire(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self._timeouts += 1
+                raise PoolTimeout(f"no database connection free after {self.timeout}s")
+            except (pymysql.err.MySQLError, OSError) as e:
+                raise PoolError(f"Database connection error: {e}") from e
+            if not self.validate:
+                break
+            try:
+                await conn.ping(reconnect=False)
+                break
+            except (pymysql.err.MySQLError, OSError):
+                self._invalidated += 1
+                conn.close()
+                self._pool.release(conn)
+
+        waited = time.monotonic() - started
+        self._in_use += 1
+        self._borrows += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        observe_pool_wait(self.name, waited)
+        return conn
+
+    async def release(self, conn, broken=False):
+        """Return a borrowed connection; broken ones are closed instead of reused."""
+        try:
+            if not broken and conn.get_transaction_status():
+                # Never hand the next borrower someone else's open transaction.
+                await conn.rollback()
+        except (pymysql.err.MySQLError, OSError):
+            broken = True
+        if broken:
+            conn.close()
+        self._in_use -= 1
+        self._pool.release(conn)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Async context manager yielding a pooled connection.
+
+        Uncommitted work is rolled back when the block exits, so handlers only
+        need to ``await conn.commit()`` on their success path.
+        """
+        conn = await self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError, OSError):
+            broken = True
+            raise
+        finally:
+            await self.release(conn, broken=broken)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "in_use": self._in_use,
+            "idle": self._pool.freesize if self._pool is not None else 0,
+            "invalidated": self._invalidated,
+            "borrows": self._borrows,
+            "timeouts": self._timeouts,
+            "wait_seconds_total": round(self._wait_total, 6),
+            "wait_seconds_max": round(self._wait_max, 6),
+        }
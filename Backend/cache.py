@@ -0,0 +1,198 @@
+"""Read-through cache with pluggable backends for the RAAH-SETU API.
+
+Entries are tagged with a per-key generation number. ``invalidate`` bumps the
+generation, and a value loaded from the database is stored under the
+generation that was current *before* the load started. A reader racing with a
+writer can therefore never park a stale value in the cache: its entry carries
+an old generation and is treated as a miss.
+
+Two backends are provided:
+
+* ``InProcessBackend`` - an LRU dict with per-entry TTL (default).
+* ``RedisBackend`` - shared between API processes. It needs only
+  ``mget``, ``set(..., ex=)``, ``incr`` and ``delete``, so any Redis-compatible
+  server (or a local stand-in speaking that interface) can serve it.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class InProcessBackend:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, generation, value)
+        # A cached key's generation is kept in its entry. A key without an entry is at the
+        # epoch, which every invalidation bumps, so it reads as newer than any generation
+        # handed out before - without remembering every key ever invalidated.
+        self._epoch = 0
+
+    def _current(self, key):
+        entry = self._entries.get(key)
+        return self._epoch if entry is None else entry[1]
+
+    def get(self, key):
+        """Return (generation, value) if present and valid, plus the key's current generation."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, self._epoch
+            expires_at, generation, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None, self._epoch
+            self._entries.move_to_end(key)
+            return (generation, value), generation
+
+    def set(self, key, generation, value, ttl):
+        with self._lock:
+            if generation < self._current(key):
+                # Loaded before an invalidation (or before the key was evicted); never cache it
+                return
+            self._entries[key] = (time.monotonic() + ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._epoch += 1
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    def __init__(self, client, prefix="raah:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, prefix="raah:"):
+        try:
+            import redis  # type: ignore
+        except ImportError:
+            raise RuntimeError("redis must be installed to use the shared cache backend")
+        return cls(redis.Redis.from_url(url), prefix=prefix)
+
+    def _keys(self, key):
+        return self.prefix + key, self.prefix + key + ":gen"
+
+    def get(self, key):
+        data_key, gen_key = self._keys(key)
+        raw, current = self.client.mget([data_key, gen_key])
+        current = int(current or 0)
+        if raw is None:
+            return None, current
+        entry = json.loads(raw)
+        return (entry["gen"], entry["value"]), current
+
+    def set(self, key, generation, value, ttl):
+        payload = json.dumps({"gen": generation, "value": value}, default=str)
+        self.client.set(self._keys(key)[0], payload, ex=max(1, int(ttl)))
+
+    def invalidate(self, key):
+        data_key, gen_key = self._keys(key)
+        self.client.incr(gen_key)
+        self.client.delete(data_key)
+
+
+class ReadThroughCache:
+    def __init__(self, backend, ttl=60.0):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._invalidations = 0
+        self._errors = 0
+
+    @classmethod
+    def from_env(cls, prefix):
+        """Build a cache from <PREFIX>_CACHE_BACKEND / _CACHE_URL / _CACHE_TTL / _CACHE_SIZE."""
+        kind = os.getenv(f"{prefix}_CACHE_BACKEND", "memory").lower()
+        ttl = float(os.getenv(f"{prefix}_CACHE_TTL", "60"))
+        if kind == "redis":
+            url = os.getenv(f"{prefix}_CACHE_URL", "redis://localhost:6379/0")
+            backend = RedisBackend.from_url(url, prefix=f"raah:{prefix.lower()}:")
+        elif kind == "memory":
+            backend = InProcessBackend(int(os.getenv(f"{prefix}_CACHE_SIZE", "10000")))
+        else:
+            raise RuntimeError(f"unknown cache backend: {kind}")
+        return cls(backend, ttl=ttl)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() and caching its result on a miss.
+
+        A failing shared backend degrades to calling loader() directly.
+        """
+        try:
+            entry, current = self.backend.get(key)
+        except Exception:
+            self._count("_errors")
+            return loader()
+        if entry is not None and entry[0] == current:
+            self._count("_hits")
+            return entry[1]
+        self._count("_stale" if entry is not None else "_misses")
+
+        value = loader()
+        try:
+            # Stored under the generation seen before loading; an invalidation that
+            # raced with the load makes this entry stale immediately.
+            self.backend.set(key, current, value, self.ttl)
+        except Exception:
+            self._count("_errors")
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """Async variant of get_or_load for an awaitable loader().
+
+        Backend calls stay synchronous: the in-process backend never blocks, and
+        a shared backend round trip is short compared with the database load.
+        """
+        try:
+            entry, current = self.backend.get(key)
+        except Exception:
+            self._count("_errors")
+            return await loader()
+        if entry is not None and entry[0] == current:
+            self._count("_hits")
+            return entry[1]
+        self._count("_stale" if entry is not None else "_misses")
+
+        value = await loader()
+        try:
+            self.backend.set(key, current, value, self.ttl)
+        except Exception:
+            self._count("_errors")
+        return value
+
+    def invalidate(self, key):
+        self._count("_invalidations")
+        try:
+            self.backend.invalidate(key)
+        except Exception:
+            self._count("_errors")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._stale
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "invalidations": self._invalidations,
+                "errors": self._errors,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
@@ -7,6 +7,31 @@ DB_CONFIG = {
     "password": "",
 }
 
+def rebuild_user_summary(cursor):
+    """Recompute every user_summary row from incidents, health_checks, sos_alerts and emergency_contacts"""
+    cursor.execute("""
+        REPLACE INTO user_summary (
+            user_id, incidents_reported, incidents_in_progress, incidents_resolved,
+            latest_mood, latest_heart_rate, latest_health_check_at,
+            active_sos_count, contact_count
+        )
+        SELECT
+            u.id,
+            (SELECT COUNT(*) FROM incidents i WHERE i.user_id = u.id AND i.status = 'reported'),
+            (SELECT COUNT(*) FROM incidents i WHERE i.user_id = u.id AND i.status = 'in_progress'),
+            (SELECT COUNT(*) FROM incidents i WHERE i.user_id = u.id AND i.status = 'resolved'),
+            h.mood, h.heart_rate, h.created_at,
+            (SELECT COUNT(*) FROM sos_alerts s WHERE s.user_id = u.id AND s.status = 'active'),
+            (SELECT COUNT(*) FROM emergency_contacts c WHERE c.user_id = u.id)
+        FROM users u
+        LEFT JOIN health_checks h ON h.id = (
+            SELECT id FROM health_checks
+            WHERE user_id = u.id
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        )
+    """)
+
 def create_database_schema():
     """Create database and tables for RAAH-SETU application"""
     try:
@@ -59,6 +84,7 @@ def create_database_schema():
                 location VARCHAR(255),
                 notes TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_health_checks_user_created (user_id, created_at, id),
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
             )
         """)
@@ -76,6 +102,7 @@ def create_database_schema():
                 status ENUM('reported', 'in_progress', 'resolved') DEFAULT 'reported',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_incidents_user_created (user_id, created_at, id),
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
             )
         """)
@@ -89,6 +116,7 @@ def create_database_schema():
                 description TEXT,
                 location VARCHAR(255),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_activities_user_created (user_id, created_at, id),
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
             )
         """)
@@ -102,6 +130,9 @@ def create_database_schema():
                 status ENUM('active', 'resolved') DEFAULT 'active',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 resolved_at TIMESTAMP NULL,
+                first_notified_ms INT NULL,
+                all_notified_ms INT NULL,
+                dispatch_started_at TIMESTAMP NULL,
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
             )
         """)
@@ -148,6 +179,82 @@ def create_database_schema():
             )
         """)
 
+        # Create sos_deliveries table (one row per recipient and channel of an SOS alert)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sos_deliveries (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                sos_id INT NOT NULL,
+                recipient_type ENUM('contact', 'guardian') NOT NULL,
+                recipient_id INT NOT NULL,
+                channel VARCHAR(20) NOT NULL,
+                address VARCHAR(255),
+                status ENUM('pending', 'sending', 'sent', 'failed') DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                error VARCHAR(255),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP NULL,
+                INDEX idx_sos_deliveries_sos (sos_id),
+                FOREIGN KEY (sos_id) REFERENCES sos_alerts(id) ON DELETE CASCADE
+            )
+        """)
+
+        # Create user_summary table (dashboard counters, maintained by api_enhanced.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_summary (
+                user_id INT PRIMARY KEY,
+                incidents_reported INT NOT NULL DEFAULT 0,
+                incidents_in_progress INT NOT NULL DEFAULT 0,
+                incidents_resolved INT NOT NULL DEFAULT 0,
+                latest_mood VARCHAR(50),
+                latest_heart_rate INT,
+                latest_health_check_at TIMESTAMP NULL,
+                active_sos_count INT NOT NULL DEFAULT 0,
+                contact_count INT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        """)
+
+        # Add history indexes to tables created before they were part of the schema
+        history_indexes = [
+            ("health_checks", "idx_health_checks_user_created"),
+            ("incidents", "idx_incidents_user_created"),
+            ("activities", "idx_activities_user_created"),
+        ]
+        for table, index in history_indexes:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+                (table, index)
+            )
+            if not cursor.fetchone():
+                cursor.execute(f"CREATE INDEX {index} ON {table} (user_id, created_at, id)")
+
+        # Add SOS notification timing columns to sos_alerts tables created before them
+        for column in ("first_notified_ms", "all_notified_ms"):
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = 'sos_alerts' AND column_name = %s",
+                (column,)
+            )
+            if not cursor.fetchone():
+                cursor.execute(f"ALTER TABLE sos_alerts ADD COLUMN {column} INT NULL")
+
+        # Add the fan-out claim to sos_alerts tables created before it; alerts that already have
+        # delivery rows count as claimed
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = 'sos_alerts' AND column_name = 'dispatch_started_at'"
+        )
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE sos_alerts ADD COLUMN dispatch_started_at TIMESTAMP NULL")
+            cursor.execute(
+                "UPDATE sos_alerts SET dispatch_started_at = created_at WHERE id IN (SELECT sos_id FROM sos_deliveries)"
+            )
+        cursor.execute(
+            "ALTER TABLE sos_deliveries MODIFY status ENUM('pending', 'sending', 'sent', 'failed') DEFAULT 'pending'"
+        )
+
+        # Rebuild user_summary from the source tables (safe to re-run)
+        rebuild_user_summary(cursor)
+
         conn.commit()
         print("✅ Database schema created successfully!")
         print("✅ Tables created:")
@@ -160,6 +267,8 @@ def create_database_schema():
         print("   - alerts")
         print("   - notifications")
         print("   - guardians")
+        print("   - sos_deliveries")
+        print("   - user_summary")
 
     except Error as e:
         print(f"❌ Error creating database schema: {e}")
@@ -0,0 +1,221 @@
+"""Bounded MySQL connection pool shared by the RAAH-SETU API.
+
+Connections are created lazily up to ``size``. Borrowers wait (up to
+``timeout`` seconds) for a free slot instead of opening extra connections,
+idle connections are pinged before they are handed out, and connections
+older than ``max_lifetime`` are recycled so MySQL's ``wait_timeout`` never
+bites us mid-request.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+try:
+    from .metrics import observe_connect, observe_pool_wait, timed_connection
+except ImportError:  # imported as a top-level module from the Backend folder
+    from metrics import observe_connect, observe_pool_wait, timed_connection
+
+
+class PoolError(Exception):
+    """Raised when the pool cannot hand out a usable connection."""
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection became free within the borrow timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+
+
+class ConnectionPool:
+    # Driver hooks; subclasses override these for other DB-API drivers
+    backend = "mysql"
+    errors = (Error,)
+
+    def __init__(self, db_config, size=10, timeout=5.0, max_lifetime=1800.0, validate=True, name="main"):
+        self.db_config = dict(db_config)
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.validate = validate
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = deque()
+
+        # Counters exposed through stats()
+        self._in_use = 0
+        self._created = 0
+        self._recycled = 0
+        self._invalidated = 0
+        self._borrows = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, db_config, prefix="DB_POOL", **kwargs):
+        """Build a pool sized by the <prefix>_* (default DB_POOL_*) environment variables."""
+        return cls(
+            db_config,
+            size=int(os.getenv(f"{prefix}_SIZE", "10")),
+            timeout=float(os.getenv(f"{prefix}_TIMEOUT", "5")),
+            max_lifetime=float(os.getenv(f"{prefix}_MAX_LIFETIME", "1800")),
+            validate=os.getenv(f"{prefix}_VALIDATE", "true").lower() in ("1", "true", "yes"),
+            **kwargs,
+        )
+
+    def _open(self):
+        return mysql.connector.connect(**self.db_config)
+
+    @staticmethod
+    def _unread_result(conn):
+        return conn.unread_result
+
+    @staticmethod
+    def _in_transaction(conn):
+        return conn.in_transaction
+
+    def _connect(self):
+        started = time.perf_counter()
+        try:
+            conn = self._open()
+        except self.errors as e:
+            raise PoolError(f"Database connection error: {e}") from e
+        observe_connect(self.backend, time.perf_counter() - started)
+        with self._lock:
+            self._created += 1
+        return _PooledConnection(timed_connection(conn, self.backend))
+
+    def _expired(self, pooled):
+        return self.max_lifetime and time.monotonic() - pooled.created_at > self.max_lifetime
+
+    def _alive(self, pooled):
+        try:
+            pooled.conn.ping(reconnect=False)
+            return True
+        except self.errors:
+            return False
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except self.errors:
+            pass
+
+    def acquire(self):
+        """Borrow a connection, waiting for a free slot if the pool is exhausted."""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"no database connection free after {self.timeout}s")
+        waited = time.monotonic() - started
+
+        try:
+            pooled = None
+            while True:
+                with self._lock:
+                    candidate = self._idle.pop() if self._idle else None
+                if candidate is None:
+                    pooled = self._connect()
+                    break
+                if self._expired(candidate):
+                    self._discard(candidate)
+                    with self._lock:
+                        self._recycled += 1
+                    continue
+                if self.validate and not self._alive(candidate):
+                    self._discard(candidate)
+                    with self._lock:
+                        self._invalidated += 1
+                    continue
+                pooled = candidate
+                break
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._borrows += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        observe_pool_wait(self.name, waited)
+        return pooled
+
+    def release(self, pooled, broken=False):
+        """Return a borrowed connection; broken or expired ones are closed instead."""
+        try:
+            if not broken and not self._expired(pooled):
+                try:
+                    # An abandoned unbuffered result would have to be drained row by
+                    # row before the connection is usable again; reconnecting is cheaper.
+                    if self._unread_result(pooled.conn):
+                        broken = True
+                    # Never hand the next borrower someone else's open transaction.
+                    elif self._in_transaction(pooled.conn):
+                        pooled.conn.rollback()
+                except self.errors:
+                    broken = True
+            if broken or self._expired(pooled):
+                self._discard(pooled)
+                with self._lock:
+                    self._recycled += 1
+            else:
+                with self._lock:
+                    self._idle.append(pooled)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection.
+
+        Uncommitted work is rolled back when the block exits, so handlers only
+        need to call ``conn.commit()`` on their success path.
+        """
+        pooled = self.acquire()
+        broken = False
+        try:
+            yield pooled.conn
+        except self.errors:
+            broken = not self._alive(pooled)
+            raise
+        finally:
+            self.release(pooled, broken=broken)
+
+    def close_all(self):
+        """Close every idle connection (borrowed ones are closed on release)."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self._created,
+                "recycled": self._recycled,
+                "invalidated": self._invalidated,
+                "borrows": self._borrows,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+            }
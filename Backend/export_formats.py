@@ -0,0 +1,195 @@
+"""Chunked table export encoders for the form DB service (api.py).
+
+Rows are pulled from a cursor with ``fetchmany()`` and encoded one chunk at a
+time, so memory stays flat whatever the table size. Supported formats are
+JSON (the ``{"columns": [...], "rows": [[...]]}`` document), NDJSON, CSV,
+and, when pyarrow is installed, Arrow IPC stream and Parquet. Any format can
+be gzip-compressed on the fly.
+"""
+import csv
+import io
+import json
+import time
+import zlib
+from decimal import Decimal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for arrow / parquet exports
+    pa = pq = None
+
+EXPORT_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+COLUMNAR_FORMATS = {"arrow", "parquet"}
+COMPRESSIONS = {"gzip"}
+PARQUET_ROW_GROUP_ROWS = 65536
+
+
+def check_export_format(fmt, compress=None):
+    """Return an error message for an unsupported format/compression, else None."""
+    if fmt not in EXPORT_FORMATS:
+        return f"format must be one of {', '.join(EXPORT_FORMATS)}"
+    if fmt in COLUMNAR_FORMATS and pa is None:
+        return f"{fmt} export needs pyarrow installed"
+    if compress is not None and compress not in COMPRESSIONS:
+        return "compress must be gzip"
+    return None
+
+
+def arrow_type(declared):
+    """Arrow type for a declared SQL column type, following SQLite's affinity rules."""
+    decl = (declared or "").upper()
+    if "INT" in decl:
+        return pa.int64()
+    if any(k in decl for k in ("REAL", "FLOA", "DOUB", "DEC", "NUM")):
+        return pa.float64()
+    if "BLOB" in decl or "BINARY" in decl:
+        return pa.binary()
+    return pa.string()
+
+
+def _as_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8", "replace")
+    return str(value)
+
+
+def _record_batch(schema, rows):
+    arrays = []
+    for i, field in enumerate(schema):
+        values = [row[i] for row in rows]
+        if pa.types.is_string(field.type):
+            values = [_as_text(v) for v in values]
+        elif pa.types.is_floating(field.type):
+            values = [float(v) if isinstance(v, Decimal) else v for v in values]
+        try:
+            arrays.append(pa.array(values, type=field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError) as e:
+            raise ValueError(f"column {field.name}: {e}") from e
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Sink:
+    """Write-only file object that hands pyarrow's output back chunk by chunk."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _encode(chunks, columns, column_types, fmt):
+    if fmt == "json":
+        yield ('{"columns": ' + json.dumps(columns) + ', "rows": [').encode()
+        first = True
+        for rows in chunks:
+            body = ", ".join(json.dumps(list(r), default=str) for r in rows)
+            yield (body if first else ", " + body).encode()
+            first = False
+        yield b"]}"
+
+    elif fmt == "ndjson":
+        for rows in chunks:
+            yield "".join(json.dumps(dict(zip(columns, r)), default=str) + "\n" for r in rows).encode()
+
+    elif fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode()
+
+    else:
+        schema = pa.schema([(name, arrow_type(t)) for name, t in zip(columns, column_types)])
+        sink = _Sink()
+        if fmt == "arrow":
+            writer = pa.ipc.new_stream(sink, schema)
+            for rows in chunks:
+                writer.write_batch(_record_batch(schema, rows))
+                yield sink.drain()
+        else:
+            # Parquet wants large row groups; buffer fetch chunks up to one group
+            writer = pq.ParquetWriter(sink, schema)
+            pending, pending_rows = [], 0
+            for rows in chunks:
+                pending.append(_record_batch(schema, rows))
+                pending_rows += len(rows)
+                if pending_rows >= PARQUET_ROW_GROUP_ROWS:
+                    writer.write_table(pa.Table.from_batches(pending))
+                    pending, pending_rows = [], 0
+                    yield sink.drain()
+            if pending:
+                writer.write_table(pa.Table.from_batches(pending))
+        writer.close()
+        yield sink.drain()
+
+
+def _gzip(parts):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for part in parts:
+        out = compressor.compress(part)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def export_stream(cur, columns, fmt, chunk_rows, column_types=None, compress=None, on_done=None):
+    """Yield the encoded export of an executed cursor.
+
+    ``column_types`` (declared SQL types) are only needed for arrow/parquet.
+    ``on_done(rows, seconds, completed)`` runs once the stream ends or is
+    abandoned, and is where the caller releases the connection.
+    """
+    started = time.perf_counter()
+    state = {"rows": 0, "completed": False}
+
+    def chunks():
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                return
+            state["rows"] += len(rows)
+            yield rows
+
+    parts = _encode(chunks(), columns, column_types or [None] * len(columns), fmt)
+    if compress == "gzip":
+        parts = _gzip(parts)
+    try:
+        yield from parts
+        state["completed"] = True
+    finally:
+        if on_done is not None:
+            on_done(state["rows"], time.perf_counter() - started, state["completed"])
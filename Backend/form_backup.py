@@ -0,0 +1,380 @@
+"""Online backups and compaction of per-form SQLite files (api.py).
+
+Backups use SQLite's online backup API. Each step copies ``step_pages`` pages
+and then sleeps ``step_sleep`` seconds. The source is only read for one step
+at a time, so the service's writers keep committing and WAL checkpoints are
+not held back for the whole copy. When a writer commits mid-copy, SQLite
+restarts the copy. After ``max_restarts`` restarts, the remaining copy is
+taken in one step from a single snapshot; in WAL mode that still doesn't
+block writers. The copy goes to a ``.partial`` file, is fsynced, and is then
+renamed to ``<BACKUP_DIR>/<form>/<form>-<UTC time>.db``. Only the newest
+``keep`` copies per form are kept.
+
+Compaction uses ``VACUUM INTO`` to write a defragmented copy of a form from a
+read snapshot, again without blocking writers. The copy then replaces the
+live file on the form's writer lane. It is swapped in only if ``PRAGMA
+data_version`` shows no commit since the snapshot; otherwise it is retried.
+The last attempt runs the whole VACUUM INTO on the lane. Scheduled runs pick
+the forms with the most free pages, and skip forms whose free pages are
+below ``min_free_ratio`` or ``min_free_bytes``.
+
+Every backup reports bytes copied, pages and duration. Every compaction
+reports pages and bytes reclaimed and duration.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from . import metrics
+
+BACKUP_BYTES = metrics.REGISTRY.counter("form_backup_bytes_total", "Bytes written by form backups")
+BACKUP_SECONDS = metrics.REGISTRY.histogram(
+    "form_backup_duration_seconds", "Wall time of form backups",
+    buckets=(0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0))
+BACKUP_ERRORS = metrics.REGISTRY.counter("form_backup_errors_total", "Form backups that failed")
+COMPACT_PAGES = metrics.REGISTRY.counter("form_compact_pages_reclaimed_total", "Pages reclaimed by compaction")
+COMPACT_SECONDS = metrics.REGISTRY.histogram(
+    "form_compact_duration_seconds", "Wall time of form compactions",
+    buckets=(0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0))
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def page_stats(path):
+    """Page size, page count and free pages of a database, and its file and WAL sizes."""
+    conn = sqlite3.connect(path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        "bytes": page_size * pages,
+        "file_bytes": os.path.getsize(path),
+        "wal_bytes": os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0,
+        "page_size": page_size,
+        "pages": pages,
+        "free_pages": free,
+        "free_ratio": round(free / pages, 4) if pages else 0.0,
+    }
+
+
+def backup_database(src, dest, step_pages=256, step_sleep=0.005, max_restarts=5):
+    """Copy ``src`` to ``dest`` with the online backup API; returns a report."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = dest + ".partial"
+    started = time.monotonic()
+    state = {"steps": 0, "restarts": 0, "remaining": None, "pages": 0}
+
+    def progress(status, remaining, total):
+        state["steps"] += 1
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > max_restarts:
+                raise _Restarted()
+        state["remaining"] = remaining
+        state["pages"] = total
+
+    source = sqlite3.connect(src)
+    target = sqlite3.connect(tmp)
+    single_step = False
+    try:
+        try:
+            source.backup(target, pages=step_pages, progress=progress, sleep=step_sleep)
+        except _Restarted:
+            # Writers keep invalidating the copy: take the rest from one snapshot
+            single_step = True
+            source.backup(target, pages=-1)
+            state["pages"] = target.execute("PRAGMA page_count").fetchone()[0]
+        target.close()
+        _fsync(tmp)
+        os.replace(tmp, dest)
+        _fsync(os.path.dirname(dest))
+    except BaseException:
+        target.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        source.close()
+    seconds = time.monotonic() - started
+    size = os.path.getsize(dest)
+    BACKUP_BYTES.inc(amount=size)
+    BACKUP_SECONDS.observe(seconds)
+    return {
+        "path": dest,
+        "bytes": size,
+        "pages": state["pages"],
+        "steps": state["steps"],
+        "restarts": state["restarts"],
+        "single_step": single_step,
+        "seconds": round(seconds, 3),
+    }
+
+
+def _vacuum_into(path, tmp):
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    try:
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        conn.execute("VACUUM INTO ?", (tmp,))
+    except BaseException:
+        conn.close()
+        raise
+    return conn, version
+
+
+def _swap(path, tmp, gate):
+    # The compacted copy already holds everything the old WAL did. No connection of the
+    # service is open while the gate is held, so none can pair the new file with the old WAL
+    # or read the old file after the swap.
+    _fsync(tmp)
+    with gate(path):
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.replace(tmp, path)
+        _fsync(os.path.dirname(path))
+
+
+def compact_database(path, exclusive, gate, attempts=3):
+    """Replace ``path`` with a ``VACUUM INTO`` copy; returns a report.
+
+    ``exclusive(fn)`` runs ``fn`` while no other writer can touch the form (its
+    writer lane), and ``gate(path)`` is a context manager that keeps the service's
+    connections off the file while it is swapped.
+    """
+    started = time.monotonic()
+    before = page_stats(path)
+    tmp = path + ".compact"
+    swapped, tries = False, 0
+    try:
+        while not swapped and tries < attempts - 1:
+            tries += 1
+            conn, version = _vacuum_into(path, tmp)
+
+            def swap_if_unchanged():
+                if conn.execute("PRAGMA data_version").fetchone()[0] != version:
+                    return False
+                conn.close()
+                _swap(path, tmp, gate)
+                return True
+            try:
+                swapped = exclusive(swap_if_unchanged)
+            finally:
+                conn.close()
+        if not swapped:
+            # The form kept changing under us: vacuum with its writers held off
+            tries += 1
+
+            def vacuum_and_swap():
+                conn, _ = _vacuum_into(path, tmp)
+                conn.close()
+                _swap(path, tmp, gate)
+            exclusive(vacuum_and_swap)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    after = page_stats(path)
+    seconds = time.monotonic() - started
+    # Sizes come from page counts: the swap also drops the WAL, which is not space compaction freed
+    reclaimed = max(0, before["pages"] - after["pages"])
+    COMPACT_PAGES.inc(amount=reclaimed)
+    COMPACT_SECONDS.observe(seconds)
+    return {
+        "pages_before": before["pages"],
+        "pages_after": after["pages"],
+        "pages_reclaimed": reclaimed,
+        "bytes_before": before["bytes"],
+        "bytes_after": after["bytes"],
+        "bytes_reclaimed": reclaimed * before["page_size"],
+        "attempts": tries,
+        "seconds": round(seconds, 3),
+    }
+
+
+class FormMaintenance:
+    def __init__(self, backup_dir, forms, exclusive, gate, keep=7, step_pages=256, step_sleep=0.005,
+                 max_restarts=5, backup_interval=86400.0, compact_interval=86400.0, compact_forms=5,
+                 min_free_ratio=0.2, min_free_bytes=1 << 20):
+        self.backup_dir = backup_dir
+        self.forms = forms              # () -> [(form name, database path)]
+        self.exclusive = exclusive      # (path, fn) -> fn() on the form's writer lane
+        self.gate = gate                # (path) -> context keeping the service's connections off it
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self.backup_interval = backup_interval
+        self.compact_interval = compact_interval
+        self.compact_forms = compact_forms
+        self.min_free_ratio = min_free_ratio
+        self.min_free_bytes = min_free_bytes
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_backup_run = None
+        self.last_compact_run = None
+
+    @classmethod
+    def from_env(cls, backup_dir, forms, exclusive, gate):
+        """Build maintenance tuned by the BACKUP_* / COMPACT_* environment variables."""
+        return cls(
+            os.getenv("BACKUP_DIR", backup_dir), forms, exclusive, gate,
+            keep=int(os.getenv("BACKUP_KEEP", "7")),
+            step_pages=int(os.getenv("BACKUP_STEP_PAGES", "256")),
+            step_sleep=float(os.getenv("BACKUP_STEP_SLEEP", "0.005")),
+            max_restarts=int(os.getenv("BACKUP_MAX_RESTARTS", "5")),
+            backup_interval=float(os.getenv("BACKUP_INTERVAL", "86400")),
+            compact_interval=float(os.getenv("COMPACT_INTERVAL", "86400")),
+            compact_forms=int(os.getenv("COMPACT_FORMS", "5")),
+            min_free_ratio=float(os.getenv("COMPACT_MIN_FREE_RATIO", "0.2")),
+            min_free_bytes=int(os.getenv("COMPACT_MIN_FREE_BYTES", str(1 << 20))),
+        )
+
+    # ---- backups ----
+
+    def backups(self, form):
+        """Backups of ``form``, newest first."""
+        directory = os.path.join(self.backup_dir, form)
+        if not os.path.isdir(directory):
+            return []
+        files = [(os.stat(os.path.join(directory, f)), f) for f in os.listdir(directory) if f.endswith(".db")]
+        files.sort(key=lambda e: (e[0].st_mtime_ns, e[1]), reverse=True)
+        return [{"file": f, "bytes": st.st_size} for st, f in files]
+
+    def backup(self, form, path):
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        dest = os.path.join(self.backup_dir, form, f"{form}-{stamp}.db")
+        n = 1
+        while os.path.exists(dest):
+            n += 1
+            dest = os.path.join(self.backup_dir, form, f"{form}-{stamp}-{n}.db")
+        report = backup_database(path, dest, self.step_pages, self.step_sleep, self.max_restarts)
+        for old in self.backups(form)[self.keep:]:
+            os.remove(os.path.join(self.backup_dir, form, old["file"]))
+        report["form"] = form
+        return report
+
+    def backup_all(self):
+        started = time.monotonic()
+        run = {"forms": 0, "bytes": 0, "failed": {}}
+        for form, path in self.forms():
+            if self._stop.is_set():
+                break
+            try:
+                report = self.backup(form, path)
+            except Exception as e:
+                BACKUP_ERRORS.inc()
+                run["failed"][form] = str(e)
+                continue
+            run["forms"] += 1
+            run["bytes"] += report["bytes"]
+        run["seconds"] = round(time.monotonic() - started, 3)
+        run["finished_at"] = time.time()
+        self.last_backup_run = run
+        print(f"Backup: {run['forms']} form(s), {run['bytes']} bytes in {run['seconds']}s"
+              + (f", {len(run['failed'])} failed" if run["failed"] else ""))
+        return run
+
+    # ---- compaction ----
+
+    def compaction_candidates(self):
+        """Forms worth compacting, most free space first: ``[(form, path, page stats)]``."""
+        candidates = []
+        for form, path in self.forms():
+            try:
+                stats = page_stats(path)
+            except sqlite3.Error:
+                continue
+            free_bytes = stats["free_pages"] * stats["page_size"]
+            if stats["free_ratio"] >= self.min_free_ratio and free_bytes >= self.min_free_bytes:
+                candidates.append((free_bytes, form, path, stats))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [(form, path, stats) for _, form, path, stats in candidates[:self.compact_forms]]
+
+    def compact(self, form, path):
+        # One compaction at a time: each one needs free disk space for a full copy
+        with self._lock:
+            report = compact_database(path, lambda fn: self.exclusive(path, fn), self.gate)
+        report["form"] = form
+        return report
+
+    def compact_some(self):
+        started = time.monotonic()
+        run = {"forms": 0, "pages_reclaimed": 0, "bytes_reclaimed": 0, "failed": {}}
+        for form, path, _ in self.compaction_candidates():
+            if self._stop.is_set():
+                break
+            try:
+                report = self.compact(form, path)
+            except Exception as e:
+                run["failed"][form] = str(e)
+                continue
+            run["forms"] += 1
+            run["pages_reclaimed"] += report["pages_reclaimed"]
+            run["bytes_reclaimed"] += report["bytes_reclaimed"]
+        run["seconds"] = round(time.monotonic() - started, 3)
+        run["finished_at"] = time.time()
+        self.last_compact_run = run
+        print(f"Compaction: {run['forms']} form(s), {run['pages_reclaimed']} pages / "
+              f"{run['bytes_reclaimed']} bytes reclaimed in {run['seconds']}s")
+        return run
+
+    # ---- schedule ----
+
+    def start(self):
+        """Run backups every ``backup_interval`` and compaction every ``compact_interval`` seconds (0: never)."""
+        if self._thread is not None or not (self.backup_interval > 0 or self.compact_interval > 0):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="form-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        now = time.monotonic()
+        next_backup = now + self.backup_interval if self.backup_interval > 0 else None
+        next_compact = now + self.compact_interval if self.compact_interval > 0 else None
+        while True:
+            wake = min(t for t in (next_backup, next_compact) if t is not None)
+            if self._stop.wait(max(0.0, wake - time.monotonic())):
+                return
+            now = time.monotonic()
+            try:
+                if next_backup is not None and now >= next_backup:
+                    next_backup = now + self.backup_interval
+                    self.backup_all()
+                if next_compact is not None and now >= next_compact:
+                    next_compact = now + self.compact_interval
+                    self.compact_some()
+            except Exception as e:
+                print(f"Form maintenance run failed: {e}")
+
+    def stats(self):
+        return {
+            "backup_dir": self.backup_dir,
+            "backup_interval": self.backup_interval,
+            "compact_interval": self.compact_interval,
+            "last_backup_run": self.last_backup_run,
+            "last_compact_run": self.last_compact_run,
+        }
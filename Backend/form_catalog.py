@@ -0,0 +1,117 @@
+"""In-memory catalog of forms, tables and column schemas (api.py).
+
+Loaded once at startup and kept current by the endpoints that change it
+(create_form, create_table, drop_table, drop_database), so existence checks,
+list_forms, show_tables, describe_table and column validation are answered
+from memory instead of the filesystem or ``sqlite_master`` / ``SHOW TABLES``.
+
+In SQLite mode every form has its own tables. In MariaDB mode all forms share
+the one database named in MARIADB_URL, so they share one table map too.
+"""
+import bisect
+import os
+import threading
+
+
+class TableInfo:
+    __slots__ = ("columns", "types", "desc")
+
+    def __init__(self, columns, types, desc):
+        self.columns = list(columns)     # column names, in table order
+        self.types = dict(types)         # column name -> declared SQL type
+        self.desc = desc                 # describe_table payload for this backend
+
+
+class FormCatalog:
+    def __init__(self, shared_tables=False):
+        self.shared_tables = shared_tables
+        self._lock = threading.Lock()
+        self._forms = set()
+        self._names = []    # sorted form names, for list_forms paging
+        self._tables = {}
+
+    def _scope(self, path):
+        return None if self.shared_tables else path
+
+    @staticmethod
+    def _name(path):
+        return os.path.basename(path)[:-len(".db")]
+
+    def load(self, forms, tables):
+        """Replace the catalog: ``forms`` is an iterable of form paths, ``tables``
+        maps scope (form path, or None when shared) to ``{table: TableInfo}``."""
+        with self._lock:
+            self._forms = set(forms)
+            self._names = sorted({self._name(p) for p in self._forms})
+            self._tables = {scope: dict(t) for scope, t in tables.items()}
+
+    # ---- forms ----
+
+    def has_form(self, path):
+        with self._lock:
+            return path in self._forms
+
+    def add_form(self, path):
+        with self._lock:
+            if path not in self._forms:
+                self._forms.add(path)
+                name = self._name(path)
+                i = bisect.bisect_left(self._names, name)
+                if i == len(self._names) or self._names[i] != name:
+                    self._names.insert(i, name)
+            self._tables.setdefault(self._scope(path), {})
+
+    def drop_form(self, path):
+        with self._lock:
+            if path in self._forms:
+                self._forms.discard(path)
+                name = self._name(path)
+                i = bisect.bisect_left(self._names, name)
+                if i < len(self._names) and self._names[i] == name:
+                    del self._names[i]
+            if self.shared_tables:
+                # the shared database is gone with it
+                self._tables.pop(None, None)
+            else:
+                self._tables.pop(path, None)
+
+    def form_names(self, prefix=None, after=None, limit=None):
+        """Form names in sorted order, optionally only those starting with ``prefix``,
+        those after ``after``, and at most ``limit`` of them."""
+        with self._lock:
+            names = self._names
+            start = bisect.bisect_right(names, after) if after is not None else 0
+            if prefix:
+                start = max(start, bisect.bisect_left(names, prefix))
+            end = len(names)
+            if prefix:
+                # first name past every prefixed one
+                end = bisect.bisect_left(names, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+            if limit is not None:
+                end = min(end, start + limit)
+            return names[start:end]
+
+    # ---- tables ----
+
+    def table_names(self, path):
+        with self._lock:
+            return list(self._tables.get(self._scope(path), {}))
+
+    def table(self, path, table):
+        with self._lock:
+            return self._tables.get(self._scope(path), {}).get(table)
+
+    def put_table(self, path, table, info):
+        with self._lock:
+            self._tables.setdefault(self._scope(path), {})[table] = info
+
+    def drop_table(self, path, table):
+        with self._lock:
+            self._tables.get(self._scope(path), {}).pop(table, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "forms": len(self._forms),
+                "tables": sum(len(t) for t in self._tables.values()),
+            }
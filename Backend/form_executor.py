@@ -0,0 +1,126 @@
+"""Executor for blocking form DB work awaited by async endpoints (api.py).
+
+sqlite3 calls block, so an ``async def`` endpoint must hand them to a thread
+instead of running them on the event loop. Writes to a form database go to that
+form's lane: a single-thread executor picked by hashing the database path. A
+form therefore never has two writers at once, and no request sits in SQLite's
+busy handler waiting on another request's write lock. Different forms spread
+over the lanes and write in parallel. Reads share a separate thread pool and
+run concurrently; WAL mode lets them proceed while a lane is writing.
+"""
+import asyncio
+import functools
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+
+class FormExecutor:
+    def __init__(self, write_lanes=8, read_workers=16):
+        self.write_lanes = write_lanes
+        self.read_workers = read_workers
+        self._lock = threading.Lock()
+        self._lanes = None
+        self._readers = None
+        self._queued = [0] * write_lanes
+        self._reading = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build an executor sized by the FORM_WRITE_LANES / FORM_READ_WORKERS environment variables."""
+        return cls(
+            write_lanes=int(os.getenv("FORM_WRITE_LANES", "8")),
+            read_workers=int(os.getenv("FORM_READ_WORKERS", "16")),
+        )
+
+    def _executors(self):
+        # Built on first use, and again after shutdown(), so the app can be restarted in-process
+        with self._lock:
+            if self._lanes is None:
+                self._lanes = [ThreadPoolExecutor(1, thread_name_prefix=f"form-writer-{i}")
+                               for i in range(self.write_lanes)]
+                self._readers = ThreadPoolExecutor(self.read_workers, thread_name_prefix="form-reader")
+            return self._lanes, self._readers
+
+    def lane(self, key):
+        return zlib.crc32(key.encode()) % self.write_lanes
+
+    def _count(self, lane, delta):
+        # lane None counts reads
+        with self._lock:
+            if lane is None:
+                self._reading += delta
+            else:
+                self._queued[lane] += delta
+
+    def _call(self, lane, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._count(lane, -1)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn`` on the shared pool; use for reads and for work that is not a form DB write."""
+        _, readers = self._executors()
+        self._count(None, 1)
+        return await asyncio.get_running_loop().run_in_executor(
+            readers, functools.partial(self._call, None, fn, args, kwargs))
+
+    async def write(self, key, fn, *args, **kwargs):
+        """Run ``fn`` on the lane that owns ``key`` (a form database path), after its earlier writes."""
+        lanes, _ = self._executors()
+        index = self.lane(key)
+        self._count(index, 1)
+        return await asyncio.get_running_loop().run_in_executor(
+            lanes[index], functools.partial(self._call, index, fn, args, kwargs))
+
+    def write_blocking(self, key, fn, *args, **kwargs):
+        """Like ``write()`` for plain threads (e.g. a background writer): run on ``key``'s lane and wait."""
+        lanes, _ = self._executors()
+        index = self.lane(key)
+        self._count(index, 1)
+        return lanes[index].submit(self._call, index, fn, args, kwargs).result()
+
+    def write_background(self, key, fn, *args, **kwargs):
+        """Queue ``fn`` on ``key``'s lane without waiting; failures are logged."""
+        lanes, _ = self._executors()
+        index = self.lane(key)
+        self._count(index, 1)
+        future = lanes[index].submit(self._call, index, fn, args, kwargs)
+
+        def report(f):
+            if f.exception() is not None:
+                print(f"Background write for {key} failed: {f.exception()}")
+        future.add_done_callback(report)
+        return future
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            lanes, readers = self._lanes, self._readers
+            self._lanes = self._readers = None
+        for executor in (lanes or []) + ([readers] if readers else []):
+            executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "write_lanes": self.write_lanes,
+                "read_workers": self.read_workers,
+                "queued_writes": sum(self._queued),
+                "busiest_lane": max(self._queued),
+                "reads": self._reading,
+            }
+
+
+def register_executor(name, executor):
+    """Export queued writes and running reads as gauges, refreshed on each scrape."""
+    work = metrics.REGISTRY.gauge("form_executor_tasks", "Form DB tasks queued or running", ("executor", "kind"))
+
+    @metrics.REGISTRY.on_collect
+    def collect():
+        stats = executor.stats()
+        work.set(stats["queued_writes"], name, "write")
+        work.set(stats["reads"], name, "read")
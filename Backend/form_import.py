@@ -0,0 +1,336 @@
+"""Streaming CSV / NDJSON import into form tables (api.py ``/import``).
+
+The upload is never held in memory. The endpoint spools the request body to
+a temporary file first (``IMPORT_SPOOL_DIR``), so a slow or stalled client
+only ties up its own request, never the form's writer lane, which other forms
+share. Once the upload is complete, the form's writer parses the file,
+converts each value to its column type, and hands the rows to the storage
+engine in batches of ``IMPORT_BATCH_ROWS``. The engine inserts them in one
+transaction on its import fast path.
+
+Column types come from the table when it exists, and every value must fit
+its column (an ``INTEGER`` column takes ``42`` or ``"42"``, not ``"n/a"``).
+When the import creates the table, the types are inferred from the first
+``IMPORT_INFER_ROWS`` rows. Empty CSV fields and JSON nulls become NULL.
+
+Each import is tracked as an ``ImportJob`` (rows, bytes, rows/s, state), which
+``GET /imports`` lists while the import runs and afterwards.
+"""
+import csv
+import io
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+from .storage_engine import affinity
+
+IMPORT_FORMATS = {"csv", "ndjson"}
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+IMPORT_ROWS = metrics.REGISTRY.counter(
+    "form_import_rows_total", "Rows written by CSV/NDJSON imports", ("format",))
+IMPORT_SECONDS = metrics.REGISTRY.histogram(
+    "form_import_duration_seconds", "Wall time of CSV/NDJSON imports", ("format",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0))
+
+
+class ImportDataError(ValueError):
+    """The uploaded data does not fit the table; reported to the client as 400."""
+
+
+class RowSource:
+    """Parsed rows of an upload, as value lists in ``columns`` order, with a sample read ahead for inference."""
+
+    def __init__(self, fh, fmt, sample_rows=1000):
+        self.fmt = fmt
+        text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+        if fmt == "csv":
+            self._reader = csv.reader(text)
+            try:
+                header = next(self._reader, None)
+            except (csv.Error, UnicodeDecodeError) as e:
+                raise ImportDataError(f"line 1: {e}")
+            if not header:
+                raise ImportDataError("empty upload: expected a CSV header line")
+            self.columns = [h.strip() for h in header]
+            self._rows = self._csv_rows()
+        else:
+            self._lines = enumerate(text, 1)
+            self._rows = self._ndjson_rows()
+            self.columns = []
+        self.sample = list(itertools.islice(self._rows, sample_rows))
+        if fmt == "ndjson":
+            # Columns in order of first appearance in the sample; later rows may not add new ones
+            seen = {}
+            for _, row in self.sample:
+                seen.update(dict.fromkeys(row))
+            self.columns = list(seen)
+            if not self.columns:
+                raise ImportDataError("empty upload: no rows")
+        if len(set(self.columns)) != len(self.columns):
+            raise ImportDataError("duplicate column names in header")
+
+    def _csv_rows(self):
+        reader = self._reader
+        try:
+            for row in reader:
+                if row:
+                    yield reader.line_num, row
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise ImportDataError(f"line {reader.line_num}: {e}")
+
+    def _ndjson_rows(self):
+        try:
+            for lineno, line in self._lines:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    raise ImportDataError(f"line {lineno}: invalid JSON")
+                if not isinstance(row, dict):
+                    raise ImportDataError(f"line {lineno}: expected a JSON object")
+                yield lineno, row
+        except UnicodeDecodeError as e:
+            raise ImportDataError(f"invalid UTF-8: {e}")
+
+    def sample_values(self):
+        """``(line, values)`` for the sampled rows."""
+        if self.fmt == "csv":
+            return self.sample
+        return [(lineno, [row.get(c) for c in self.columns]) for lineno, row in self.sample]
+
+    def rows(self):
+        """``(line, values)`` for every row, sample first."""
+        width = len(self.columns)
+        if self.fmt == "csv":
+            for lineno, row in itertools.chain(self.sample, self._rows):
+                if len(row) != width:
+                    if len(row) > width:
+                        raise ImportDataError(f"line {lineno}: {len(row)} fields, header has {width}")
+                    row = row + [""] * (width - len(row))
+                yield lineno, row
+        else:
+            known = set(self.columns)
+            columns = self.columns
+            for lineno, row in itertools.chain(self.sample, self._rows):
+                if len(row) > width or not known.issuperset(row):
+                    extra = sorted(set(row) - known)
+                    raise ImportDataError(f"line {lineno}: unknown column(s) {', '.join(extra)}")
+                yield lineno, [row.get(c) for c in columns]
+
+
+def _csv_kind(value):
+    try:
+        int(value)
+        return "INTEGER"
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return "REAL"
+    except ValueError:
+        return "TEXT"
+
+
+def _json_kind(value):
+    if isinstance(value, (bool, int)):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    return "TEXT"
+
+
+def infer_types(source):
+    """``{column: declared type}`` from the sampled rows: INTEGER, REAL or TEXT."""
+    kind = _csv_kind if source.fmt == "csv" else _json_kind
+    kinds = [set() for _ in source.columns]
+    for _, values in source.sample_values():
+        for seen, value in zip(kinds, values):
+            if value is not None and value != "" and len(seen) < 3:
+                seen.add(kind(value))
+    types = {}
+    for column, seen in zip(source.columns, kinds):
+        if not seen or "TEXT" in seen:
+            types[column] = "TEXT"
+        elif "REAL" in seen:
+            types[column] = "REAL"
+        else:
+            types[column] = "INTEGER"
+    return types
+
+
+def _integer(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+        raise ValueError
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if number.is_integer():
+            return int(number)
+        raise
+
+
+def _real(value):
+    if isinstance(value, (dict, list)):
+        raise ValueError
+    return float(value)
+
+
+def _numeric(value):
+    try:
+        return _integer(value)
+    except (ValueError, TypeError):
+        return _real(value)
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _blob(value):
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+CONVERTERS = {"INTEGER": _integer, "REAL": _real, "NUMERIC": _numeric, "TEXT": _text, "BLOB": _blob}
+
+
+def converters(columns, types):
+    """One ``(column, affinity, convert)`` per column; ``types`` maps columns to declared SQL types."""
+    return [(c, affinity(types.get(c)), CONVERTERS[affinity(types.get(c))]) for c in columns]
+
+
+def batches(source, types, batch_rows, job):
+    """Converted rows in lists of ``batch_rows`` tuples; keeps ``job``'s row count current."""
+    convert = converters(source.columns, types)
+    # An empty CSV field is NULL; in NDJSON only null is
+    blank = "" if source.fmt == "csv" else None
+    batch = []
+    for lineno, values in source.rows():
+        row = []
+        for (column, aff, fn), value in zip(convert, values):
+            if value is None or value == blank:
+                row.append(None)
+                continue
+            try:
+                row.append(fn(value))
+            except (ValueError, TypeError, OverflowError):
+                raise ImportDataError(f"line {lineno}, column {column!r}: {value!r} is not {aff}")
+        batch.append(tuple(row))
+        if len(batch) >= batch_rows:
+            job.progress(len(batch))
+            yield batch
+            batch = []
+    if batch:
+        job.progress(len(batch))
+        yield batch
+
+
+class ImportJob:
+    def __init__(self, job_id, form, table, fmt, log_rows=100000):
+        self.id = job_id
+        self.form = form
+        self.table = table
+        self.format = fmt
+        self.log_rows = log_rows
+        self.state = "uploading"
+        self.rows = 0
+        self.bytes = 0
+        self.created_table = False
+        self.error = None
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._finished = None
+        self._logged = 0
+
+    def seconds(self):
+        return (self._finished or time.monotonic()) - self._started
+
+    def uploaded(self):
+        """The upload is spooled; the rows are now being written."""
+        self.state = "running"
+
+    def progress(self, rows):
+        self.rows += rows
+        if self.log_rows and self.rows - self._logged >= self.log_rows:
+            self._logged = self.rows
+            print(f"import {self.id} into {self.form}.{self.table}: {self.rows} rows "
+                  f"({self.rows / max(self.seconds(), 1e-9):.0f} rows/s)")
+
+    def finish(self, error=None):
+        self._finished = time.monotonic()
+        self.state = "failed" if error is not None else "done"
+        self.error = None if error is None else str(getattr(error, "detail", error))
+        IMPORT_SECONDS.observe(self.seconds(), self.format)
+        if error is None:
+            IMPORT_ROWS.inc(self.format, amount=self.rows)
+        print(f"import {self.id} into {self.form}.{self.table} {self.state}: {self.rows} rows, {self.bytes} bytes "
+              f"in {self.seconds():.2f}s ({self.rows / max(self.seconds(), 1e-9):.0f} rows/s)"
+              + (f": {self.error}" if self.error else ""))
+
+    def summary(self):
+        seconds = self.seconds()
+        return {
+            "id": self.id,
+            "form": self.form,
+            "table": self.table,
+            "format": self.format,
+            "state": self.state,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "created_table": self.created_table,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds) if seconds > 0 else 0,
+            "started_at": self.started_at,
+            "error": self.error,
+        }
+
+
+class ImportTracker:
+    """Running imports and the most recent ``keep`` finished ones."""
+
+    def __init__(self, keep=100):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def start(self, form, table, fmt):
+        with self._lock:
+            job = ImportJob(f"imp-{next(self._ids)}", form, table, fmt,
+                            log_rows=int(os.getenv("IMPORT_LOG_ROWS", "100000")))
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.state != "running"]
+            for old in finished[:max(0, len(finished) - self.keep)]:
+                del self._jobs[old.id]
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, state=None):
+        with self._lock:
+            return [j for j in self._jobs.values() if state is None or j.state == state]
@@ -0,0 +1,146 @@
+"""SQL compilation for form table queries (api.py).
+
+Turns client-supplied projections, filters and keyset cursors into a
+parameterized SELECT. Every identifier is checked against the table's actual
+columns before it is quoted into the statement, and every value is bound as a
+parameter, so nothing from the request is interpolated into SQL.
+
+Filters are ``column:op:value`` strings; ``op`` is one of eq, ne, lt, lte,
+gt, gte. Aggregates are ``fn:column`` strings (``count`` alone counts rows);
+``fn`` is one of count, sum, avg, min, max.
+"""
+
+OPERATORS = {"eq": "=", "ne": "!=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+AGGREGATES = ("count", "sum", "avg", "min", "max")
+
+
+class QueryError(ValueError):
+    """Raised for a projection, filter or cursor the table cannot answer."""
+
+
+class Dialect:
+    def __init__(self, quote_char, placeholder):
+        self.quote_char = quote_char
+        self.placeholder = placeholder
+
+    def quote(self, name):
+        q = self.quote_char
+        return q + name.replace(q, q + q) + q
+
+
+SQLITE = Dialect('"', "?")
+MARIADB = Dialect("`", "%s")
+
+
+def check_column(name, schema):
+    if name not in schema:
+        raise QueryError(f"unknown column: {name!r}")
+    return name
+
+
+def parse_columns(spec, schema):
+    """Parse a ``columns=a,b`` projection; None or empty means every column."""
+    if not spec:
+        return None
+    names = [c.strip() for c in spec.split(",") if c.strip()]
+    return [check_column(c, schema) for c in names] or None
+
+
+def parse_filters(specs, schema):
+    """Parse ``column:op:value`` strings into ``(column, sql_operator, value)`` triples."""
+    filters = []
+    for spec in specs or ():
+        parts = spec.split(":", 2)
+        if len(parts) != 3:
+            raise QueryError(f"filter must be column:op:value, got {spec!r}")
+        column, op, value = parts
+        if op not in OPERATORS:
+            raise QueryError(f"unknown filter operator {op!r}; use one of {', '.join(OPERATORS)}")
+        filters.append((check_column(column, schema), OPERATORS[op], value))
+    return filters
+
+
+def compile_where(filters, dialect):
+    """Return ``(clauses, params)`` for a list of parsed filters."""
+    clauses = [f"{dialect.quote(column)} {op} {dialect.placeholder}" for column, op, _ in filters]
+    return clauses, [value for _, _, value in filters]
+
+
+def list_rows_query(table, schema, dialect, columns=None, filters=(), after_id=None, before_id=None, limit=100):
+    """Build the SELECT for one page of rows.
+
+    Rows come newest first (``id DESC``) unless ``after_id`` is given, in which
+    case they come in ascending id order starting after it. When paging, ``id``
+    is always selected so the caller can hand out the next cursor. Returns
+    ``(sql, params, ascending)``.
+    """
+    if (after_id is not None or before_id is not None) and "id" not in schema:
+        raise QueryError("table has no id column to page on")
+    if columns is not None and "id" in schema and "id" not in columns:
+        columns = ["id"] + columns
+
+    clauses, params = compile_where(filters, dialect)
+    if after_id is not None:
+        clauses.append(f"{dialect.quote('id')} > {dialect.placeholder}")
+        params.append(after_id)
+    if before_id is not None:
+        clauses.append(f"{dialect.quote('id')} < {dialect.placeholder}")
+        params.append(before_id)
+
+    ascending = after_id is not None
+    projection = ", ".join(dialect.quote(c) for c in columns) if columns else "*"
+    sql = f"SELECT {projection} FROM {dialect.quote(table)}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if "id" in schema:
+        sql += f" ORDER BY {dialect.quote('id')} {'ASC' if ascending else 'DESC'}"
+    sql += f" LIMIT {dialect.placeholder}"
+    params.append(limit)
+    return sql, params, ascending
+
+
+def parse_aggregates(specs, schema):
+    """Parse ``fn:column`` / ``count`` strings into ``(fn, column_or_None)`` pairs."""
+    aggregates = []
+    for spec in specs or ():
+        fn, _, column = spec.partition(":")
+        fn = fn.strip().lower()
+        if fn not in AGGREGATES:
+            raise QueryError(f"unknown aggregate {fn!r}; use one of {', '.join(AGGREGATES)}")
+        if column in ("", "*"):
+            if fn != "count":
+                raise QueryError(f"{fn} needs a column, e.g. {fn}:age")
+            column = None
+        else:
+            check_column(column, schema)
+        aggregates.append((fn, column))
+    return aggregates or [("count", None)]
+
+
+def aggregate_query(table, schema, dialect, group_by=None, aggregates=(), filters=(), limit=1000):
+    """Build a GROUP BY query; returns ``(sql, params, result_columns)``.
+
+    Result columns are the group-by columns followed by one per aggregate,
+    named ``fn_column`` (or ``count`` for a row count). Groups come ordered by
+    the group-by columns.
+    """
+    group_by = group_by or []
+    aggregates = list(aggregates) or [("count", None)]
+    selects, names = [dialect.quote(c) for c in group_by], list(group_by)
+    for fn, column in aggregates:
+        name = f"{fn}_{column}" if column else fn
+        if name in names:
+            raise QueryError(f"duplicate result column {name!r}")
+        selects.append(f"{fn.upper()}({dialect.quote(column) if column else '*'}) AS {dialect.quote(name)}")
+        names.append(name)
+
+    clauses, params = compile_where(filters, dialect)
+    sql = f"SELECT {', '.join(selects)} FROM {dialect.quote(table)}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if group_by:
+        grouped = ", ".join(dialect.quote(c) for c in group_by)
+        sql += f" GROUP BY {grouped} ORDER BY {grouped}"
+    sql += f" LIMIT {dialect.placeholder}"
+    params.append(limit)
+    return sql, params, names
@@ -0,0 +1,121 @@
+"""Spread per-form SQLite files over several data directories (api.py).
+
+Set ``FORM_DATA_DIRS`` to a comma-separated list of directories, usually on
+different volumes. Each form name is placed with consistent hashing: every
+directory gets ``vnodes`` points on a hash ring, and a form lives in the
+directory owning the first point at or after the hash of its name. When a
+directory is added, only the forms whose points it takes over move, roughly
+1/N of them.
+
+Moving those files is the job of the rebalance tool, run while the service is
+stopped:
+
+    python form_shards.py --dirs /mnt/a/form_dbs,/mnt/b/form_dbs [--dry-run]
+
+It checkpoints each form's WAL into the database file, copies the file to its
+new directory under a temporary name, fsyncs it, renames it into place and
+only then removes the original.
+"""
+import argparse
+import bisect
+import hashlib
+import os
+import shutil
+import sqlite3
+
+FORM_SUFFIXES = (".db", ".db.mariadb")
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class ShardRing:
+    def __init__(self, dirs, vnodes=64):
+        if not dirs:
+            raise ValueError("at least one data directory is required")
+        self.dirs = [os.path.abspath(d) for d in dirs]
+        self.vnodes = vnodes
+        points = sorted((_hash(f"{d}#{i}"), d) for d in self.dirs for i in range(vnodes))
+        self._points = [p for p, _ in points]
+        self._owners = [d for _, d in points]
+        for d in self.dirs:
+            os.makedirs(d, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, default_dir):
+        """Ring over FORM_DATA_DIRS, or just ``default_dir`` when it is unset."""
+        dirs = [d.strip() for d in os.getenv("FORM_DATA_DIRS", "").split(",") if d.strip()]
+        return cls(dirs or [default_dir], vnodes=int(os.getenv("FORM_SHARD_VNODES", "64")))
+
+    def dir_for(self, name):
+        """Data directory that owns form ``name``."""
+        if len(self.dirs) == 1:
+            return self.dirs[0]
+        i = bisect.bisect_left(self._points, _hash(name))
+        return self._owners[i % len(self._owners)]
+
+    def form_files(self):
+        """Yield ``(directory, filename, form_name)`` for every form file in any shard."""
+        for d in self.dirs:
+            for filename in sorted(os.listdir(d)):
+                for suffix in FORM_SUFFIXES:
+                    if filename.endswith(suffix):
+                        yield d, filename, filename[:-len(suffix)]
+                        break
+
+    def misplaced(self):
+        """Form files that are not in the directory the ring assigns them."""
+        return [(d, f, self.dir_for(name)) for d, f, name in self.form_files() if self.dir_for(name) != d]
+
+
+def _move_form(src_dir, filename, dst_dir):
+    src = os.path.join(src_dir, filename)
+    dst = os.path.join(dst_dir, filename)
+    if os.path.exists(dst):
+        raise FileExistsError(f"{dst} already exists; resolve by hand")
+    if filename.endswith(".db"):
+        # Fold the WAL into the main file so one file carries the whole database
+        conn = sqlite3.connect(src)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+    tmp = dst + ".moving"
+    shutil.copyfile(src, tmp)
+    with open(tmp, "rb") as fh:
+        os.fsync(fh.fileno())
+    os.replace(tmp, dst)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(src + suffix):
+            os.remove(src + suffix)
+    return os.path.getsize(dst)
+
+
+def rebalance(ring, dry_run=False, log=print):
+    """Move every misplaced form file to its owning directory; returns ``(files, bytes)`` moved."""
+    moved, total = 0, 0
+    for src_dir, filename, dst_dir in ring.misplaced():
+        if dry_run:
+            log(f"would move {filename}: {src_dir} -> {dst_dir}")
+            continue
+        size = _move_form(src_dir, filename, dst_dir)
+        moved += 1
+        total += size
+        log(f"moved {filename} ({size} bytes): {src_dir} -> {dst_dir}")
+    return moved, total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move form databases to the shard that owns them.")
+    parser.add_argument("--dirs", default=os.getenv("FORM_DATA_DIRS", ""),
+                        help="comma-separated data directories (default: FORM_DATA_DIRS)")
+    parser.add_argument("--vnodes", type=int, default=int(os.getenv("FORM_SHARD_VNODES", "64")))
+    parser.add_argument("--dry-run", action="store_true", help="only list the moves")
+    args = parser.parse_args()
+    dirs = [d.strip() for d in args.dirs.split(",") if d.strip()]
+    if not dirs:
+        parser.error("no data directories given (--dirs or FORM_DATA_DIRS)")
+    files, size = rebalance(ShardRing(dirs, vnodes=args.vnodes), dry_run=args.dry_run)
+    if not args.dry_run:
+        print(f"moved {files} form(s), {size} bytes")
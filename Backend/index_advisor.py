@@ -0,0 +1,70 @@
+"""Index advisor for form tables (api.py).
+
+``update_rows`` and ``list_rows`` report the columns their predicates use.
+The advisor counts each column set per form table, and once a set has been
+used ``threshold`` times it is recommended as a secondary index (or created,
+with INDEX_AUTO_CREATE=true).
+
+A predicate's key puts its equality columns first (sorted), then at most one
+range column, since a B-tree index can only use the first range column after
+its equality prefix. Predicates on ``id`` are skipped because the primary key
+already serves them.
+"""
+import os
+import threading
+
+
+def index_key(eq=(), ranges=()):
+    """``(columns, equality_count)`` for a predicate, or None if it needs no secondary index."""
+    eq = sorted(set(eq))
+    ranges = sorted(set(ranges) - set(eq))
+    if "id" in eq or (not eq and ranges[:1] in ([], ["id"])):
+        return None
+    return tuple(eq + ranges[:1]), len(eq)
+
+
+def covers(index_columns, columns, equality_count):
+    """True if an index on ``index_columns`` serves a predicate keyed ``columns``."""
+    prefix = list(index_columns[:len(columns)])
+    if len(prefix) < len(columns):
+        return False
+    # equality columns may come in any order; a range column must follow them
+    return set(prefix[:equality_count]) == set(columns[:equality_count]) and \
+        prefix[equality_count:] == list(columns[equality_count:])
+
+
+class IndexAdvisor:
+    def __init__(self, threshold=100, auto_create=False):
+        self.threshold = threshold
+        self.auto_create = auto_create
+        self._lock = threading.Lock()
+        self._uses = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold=int(os.getenv("INDEX_ADVISOR_THRESHOLD", "100")),
+            auto_create=os.getenv("INDEX_AUTO_CREATE", "false").lower() in ("1", "true", "yes"),
+        )
+
+    def record(self, form, table, eq=(), ranges=()):
+        """Count one use of a predicate; returns its ``(columns, equality_count)`` key the moment
+        it reaches the threshold."""
+        key = index_key(eq, ranges)
+        if key is None:
+            return None
+        with self._lock:
+            per_table = self._uses.setdefault((form, table), {})
+            uses = per_table[key] = per_table.get(key, 0) + 1
+        return key if uses == self.threshold else None
+
+    def usage(self, form):
+        """``{table: {(columns, equality_count): uses}}`` recorded for ``form``."""
+        with self._lock:
+            return {table: dict(keys) for (f, table), keys in self._uses.items() if f == form}
+
+    def forget(self, form, table=None):
+        with self._lock:
+            for f, t in list(self._uses):
+                if f == form and (table is None or t == table):
+                    del self._uses[(f, t)]
@@ -0,0 +1,273 @@
+"""MariaDB storage engine: every form's tables in one database (storage_engine.py).
+
+All forms share the database named by MARIADB_URL, so they share one table
+namespace; a marker file ``<form>.db.mariadb`` in the form's data directory
+records that the form exists. Work runs on the bounded ``MariaDBPool`` and
+needs no writer lanes, since InnoDB takes row locks. /submit keeps storing
+submissions in per-form SQLite files, as it always has.
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+import pymysql
+from fastapi import HTTPException
+from pymysql.constants import FIELD_TYPE
+
+from . import metrics
+from .db_pool import PoolTimeout
+from .form_catalog import TableInfo
+from .form_queries import MARIADB
+from .mariadb_pool import MariaDBPool
+from .sqlite_engine import explicit_id_ranges
+from .storage_engine import SQLEngine, export_response, stream_cursor
+
+# Rows per multi-row INSERT statement in bulk inserts
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "1000"))
+
+MARIADB_INT_TYPES = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG,
+                     FIELD_TYPE.INT24, FIELD_TYPE.YEAR}
+MARIADB_REAL_TYPES = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+
+quote = MARIADB.quote
+
+
+def mariadb_error(e):
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, PoolTimeout):
+        return HTTPException(status_code=503, detail="database busy, please retry", headers={"Retry-After": "1"})
+    return HTTPException(status_code=500, detail=str(e))
+
+
+def mariadb_type_name(type_code):
+    if type_code in MARIADB_INT_TYPES:
+        return "INTEGER"
+    if type_code in MARIADB_REAL_TYPES:
+        return "DOUBLE"
+    return "TEXT"
+
+
+def read_table(cur, table):
+    try:
+        cur.execute(f"DESC {quote(table)}")
+    except pymysql.err.ProgrammingError:
+        return None
+    rows = [list(r) for r in cur.fetchall()]
+    return TableInfo([r[0] for r in rows], {r[0]: r[1] for r in rows}, rows)
+
+
+class MariaDBEngine(SQLEngine):
+    name = "mariadb"
+    dialect = MARIADB
+    shared_tables = True
+    serialize_writes = False
+    form_suffix = ".db.mariadb"
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @classmethod
+    def from_url(cls, url):
+        """Engine on a pool for ``url`` (MARIADB_POOL_* settings)."""
+        return cls(MariaDBPool.from_url(url))
+
+    @contextmanager
+    def transaction(self, cursor_class=None):
+        """Run one request's MariaDB work on a pooled connection.
+
+        Yields a cursor; the transaction commits when the block completes and is
+        rolled back if it raises. Errors come out as HTTPException.
+        """
+        try:
+            with self.pool.connection() as conn:
+                cur = conn.cursor(cursor_class) if cursor_class else conn.cursor()
+                try:
+                    yield cur
+                    conn.commit()
+                finally:
+                    cur.close()
+        except Exception as e:
+            raise mariadb_error(e)
+
+    # ---- forms ----
+
+    def discover(self, form_paths):
+        try:
+            with self.transaction() as cur:
+                cur.execute("SHOW TABLES")
+                names = [r[0] for r in cur.fetchall()]
+                return {None: {name: read_table(cur, name) for name in names}}
+        except HTTPException as e:
+            # Tables are then looked up on first use
+            print(f"Could not load MariaDB tables into the catalog: {e.detail}")
+            return {}
+
+    def form_exists(self, p):
+        return os.path.exists(p + ".mariadb")
+
+    def create_form(self, p):
+        # The database itself is the one in MARIADB_URL; the marker file records the form
+        with open(p + ".mariadb", 'w') as fh:
+            fh.write('mariadb')
+        return {"db": "mariadb"}
+
+    def drop_form(self, p):
+        # dropping database is potentially destructive; run raw DROP DATABASE
+        dbname = self.pool.database
+        if not dbname:
+            raise HTTPException(status_code=400, detail="no db name in MARIADB_URL")
+        with self.transaction() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {quote(dbname)}")
+        # pooled connections still point at the dropped database
+        self.pool.close_all()
+        if os.path.exists(p + ".mariadb"):
+            os.remove(p + ".mariadb")
+        return {"dropped_db": dbname}
+
+    def table_listing(self, names):
+        # Same shape as SHOW TABLES rows
+        return [[name] for name in names]
+
+    # ---- tables ----
+
+    def read_tables(self, p):
+        # Shared tables are loaded once by discover()
+        return {}
+
+    def read_table(self, p, table):
+        with self.transaction() as cur:
+            return read_table(cur, table)
+
+    def create_table(self, p, table, columns):
+        sql = (f"CREATE TABLE IF NOT EXISTS {quote(table)} (id INT PRIMARY KEY AUTO_INCREMENT, "
+               + ', '.join(f"{name} {ctype}" for name, ctype in columns)
+               + ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+        with self.transaction() as cur:
+            cur.execute(sql)
+            return read_table(cur, table)
+
+    def drop_table(self, p, table):
+        with self.transaction() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+
+    # ---- rows ----
+
+    def insert_row(self, p, table, row):
+        keys = list(row)
+        sql = (f"INSERT INTO {quote(table)} ({','.join(quote(k) for k in keys)}) "
+               f"VALUES ({','.join('%s' for _ in keys)})")
+        with self.transaction() as cur:
+            cur.execute(sql, [row[k] for k in keys])
+            return cur.lastrowid
+
+    def bulk_insert(self, p, table, groups):
+        ranges = []
+        with self.transaction() as cur:
+            # Let executemany() send each chunk as a single multi-row INSERT, so
+            # lastrowid is the chunk's first id (BULK_CHUNK_ROWS bounds the packet size)
+            cur.max_stmt_length = sys.maxsize
+            for columns, values in groups:
+                cols = ','.join(quote(c) for c in columns)
+                placeholders = ','.join('%s' for _ in columns)
+                sql = f"INSERT INTO {quote(table)} ({cols}) VALUES ({placeholders})"
+                for start in range(0, len(values), BULK_CHUNK_ROWS):
+                    chunk = values[start:start + BULK_CHUNK_ROWS]
+                    cur.executemany(sql, chunk)
+                    if "id" in columns:
+                        ranges.extend(explicit_id_ranges(columns, chunk))
+                    else:
+                        ranges.append((cur.lastrowid, cur.lastrowid + len(chunk) - 1))
+        return ranges
+
+    def import_rows(self, p, table, columns, batches):
+        sql = (f"INSERT INTO {quote(table)} ({','.join(quote(c) for c in columns)}) "
+               f"VALUES ({','.join('%s' for _ in columns)})")
+        rows = 0
+        with self.transaction() as cur:
+            # Multi-row INSERTs of BULK_CHUNK_ROWS, with foreign key checks deferred for the import;
+            # the session setting is restored before the connection goes back to the pool.
+            # unique_checks stays on: tables can have UNIQUE indexes (create_index), and InnoDB may
+            # accept duplicates into them without it.
+            cur.max_stmt_length = sys.maxsize
+            cur.execute("SET SESSION foreign_key_checks = 0")
+            try:
+                for batch in batches:
+                    for start in range(0, len(batch), BULK_CHUNK_ROWS):
+                        cur.executemany(sql, batch[start:start + BULK_CHUNK_ROWS])
+                    rows += len(batch)
+            finally:
+                cur.execute("SET SESSION foreign_key_checks = 1")
+        return rows
+
+    def update_rows(self, p, table, values, where):
+        set_parts = ",".join(f"{quote(k)}=%s" for k in values)
+        where_parts = " AND ".join(f"{quote(k)}=%s" for k in where)
+        with self.transaction() as cur:
+            cur.execute(f"UPDATE {quote(table)} SET {set_parts} WHERE {where_parts}",
+                        list(values.values()) + list(where.values()))
+            return cur.rowcount
+
+    def _fetch(self, p, sql, params, mapping=False):
+        with self.transaction(pymysql.cursors.DictCursor if mapping else None) as cur:
+            cur.execute(sql, params)
+            return [dict(r) for r in cur.fetchall()] if mapping else cur.fetchall()
+
+    def _unbuffered(self, cursor_class, sql, params):
+        """Execute on an unbuffered cursor; returns ``(cursor, release)`` to hand to a stream."""
+        pooled = self.pool.acquire()
+        try:
+            cur = pooled.conn.cursor(cursor_class)
+            cur.execute(sql, params)
+        except Exception as e:
+            self.pool.release(pooled, broken=True)
+            raise mariadb_error(e)
+
+        def release(completed):
+            # Closing an unbuffered cursor reads and drops every remaining row, so a stream the
+            # client abandoned drops the connection instead
+            if completed:
+                cur.close()
+            self.pool.release(pooled, broken=not completed)
+        return cur, release
+
+    def _stream(self, p, sql, params, fmt, key):
+        cur, release = self._unbuffered(pymysql.cursors.SSDictCursor, sql, params)
+        return stream_cursor(cur, fmt, key, release)
+
+    def export(self, p, table, info, fmt, compress):
+        cur, release = self._unbuffered(pymysql.cursors.SSCursor, f"SELECT * FROM {quote(table)}", ())
+        types = [mariadb_type_name(d[1]) for d in cur.description]
+        return export_response(cur, table, fmt, compress, types, release)
+
+    # ---- indexes ----
+
+    def indexes(self, p, table):
+        with self.transaction() as cur:
+            cur.execute(f"SHOW INDEX FROM {quote(table)}")
+            rows = cur.fetchall()
+        indexes = {}
+        # Table, Non_unique, Key_name, Seq_in_index, Column_name, ...
+        for row in rows:
+            if row[2] == "PRIMARY":
+                continue
+            index = indexes.setdefault(row[2], {"name": row[2], "columns": [], "unique": not row[1]})
+            index["columns"].append(row[4])
+        return list(indexes.values())
+
+    def create_index(self, p, table, name, columns, unique):
+        with self.transaction() as cur:
+            cur.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {quote(name)} "
+                        f"ON {quote(table)} ({', '.join(quote(c) for c in columns)})")
+
+    def drop_index(self, p, table, name):
+        with self.transaction() as cur:
+            cur.execute(f"DROP INDEX {quote(name)} ON {quote(table)}")
+
+    # ---- lifecycle ----
+
+    def register_metrics(self):
+        metrics.register_pool("mariadb", self.pool)
+
+    def close(self):
+        self.pool.close_all()
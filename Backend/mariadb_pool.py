@@ -0,0 +1,57 @@
+"""Pooled pymysql connections for the form DB service's MariaDB mode.
+
+Same pool as ``db_pool.ConnectionPool`` (bounded size, borrow timeout,
+ping-on-borrow, max-lifetime recycling, rollback on release, pool metrics),
+driven through pymysql instead of mysql-connector. The DSN is parsed once,
+when the pool is built.
+"""
+import urllib.parse
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+from .db_pool import ConnectionPool
+
+
+def parse_mariadb_url(url):
+    """Turn ``mysql[+pymysql]://user:pass@host:port/dbname`` into pymysql connect() arguments."""
+    for scheme in ("mysql+pymysql://", "mysql://"):
+        if url.startswith(scheme):
+            url = url[len(scheme):]
+            break
+    parsed = urllib.parse.urlparse("//" + url)
+    return {
+        "host": parsed.hostname or "localhost",
+        "port": parsed.port or 3306,
+        "user": urllib.parse.unquote(parsed.username or ""),
+        "password": urllib.parse.unquote(parsed.password or ""),
+        "database": parsed.path.lstrip("/"),
+        "charset": "utf8mb4",
+        "autocommit": False,
+    }
+
+
+class MariaDBPool(ConnectionPool):
+    backend = "mariadb"
+    errors = (pymysql.err.MySQLError, OSError)
+
+    @classmethod
+    def from_url(cls, url, prefix="MARIADB_POOL"):
+        """Build a pool for ``url`` sized by the <prefix>_* environment variables."""
+        return cls.from_env(parse_mariadb_url(url), prefix=prefix, name="mariadb")
+
+    @property
+    def database(self):
+        return self.db_config["database"]
+
+    def _open(self):
+        return pymysql.connect(**self.db_config)
+
+    @staticmethod
+    def _unread_result(conn):
+        result = conn._result
+        return result is not None and result.unbuffered_active
+
+    @staticmethod
+    def _in_transaction(conn):
+        return bool(conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
@@ -0,0 +1,392 @@
+"""In-memory storage engine (storage_engine.py): nothing is persisted.
+
+Meant for benchmarking the HTTP layer on its own (STORAGE_ENGINE=memory takes
+disk, SQLite and MariaDB out of the measurement) and for tests. It follows
+SQLite's behaviour closely enough that clients cannot tell the difference in
+normal use: values are coerced by column type affinity, NULL sorts before
+numbers before text, comparisons with NULL never match, and ids come from an
+auto-increment counter per table.
+
+Rows live in a dict per table keyed by id, next to a sorted id list, so
+keyset pagination (``after_id`` / ``before_id``) starts with a bisect instead
+of a scan. Secondary indexes are recorded but not used for lookups, and a
+UNIQUE index is only checked against the rows present when it is created.
+"""
+import bisect
+import threading
+
+from fastapi import HTTPException
+
+from .form_catalog import TableInfo
+from .form_queries import QueryError
+from .storage_engine import (SUBMISSIONS_TABLE, ListCursor, StorageEngine, affinity, export_response,
+                             stream_cursor)
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def coerce(value, aff):
+    """Convert ``value`` the way SQLite stores it in a column of affinity ``aff``."""
+    if value is None or aff == "BLOB":
+        return value
+    if isinstance(value, (dict, list)):
+        raise HTTPException(status_code=500, detail=f"Error binding parameter: type {type(value).__name__} "
+                                                    "is not supported")
+    if aff == "TEXT":
+        return value if isinstance(value, (str, bytes)) else str(value)
+    if isinstance(value, str):
+        number = _number(value.strip())
+        if number is None:
+            return value
+        value = number
+    if isinstance(value, (int, float)):
+        if aff == "REAL":
+            return float(value)
+        if isinstance(value, float) and value.is_integer() and abs(value) < 2 ** 63:
+            return int(value)
+    return value
+
+
+def rank(value):
+    """Sort key following SQLite's ordering: NULL, then numbers, then text, then blobs."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, value)
+
+
+COMPARE = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+class _Table:
+    __slots__ = ("columns", "types", "affinity", "rows", "ids", "next_id", "indexes")
+
+    def __init__(self, columns):
+        self.columns = ["id"] + [name for name, _ in columns]
+        self.types = {"id": "INTEGER", **dict(columns)}
+        self.affinity = {name: affinity(t) for name, t in self.types.items()}
+        self.rows = {}          # id -> {column: value}
+        self.ids = []           # sorted ids
+        self.next_id = 1
+        self.indexes = {}       # name -> {"name", "columns", "unique"}
+
+    def info(self):
+        desc = [dict(cid=i, name=c, type=self.types[c], notnull=0, dflt_value=None, pk=int(c == "id"))
+                for i, c in enumerate(self.columns)]
+        return TableInfo(self.columns, self.types, desc)
+
+    def add_column(self, name, declared):
+        self.columns.append(name)
+        self.types[name] = declared
+        self.affinity[name] = affinity(declared)
+        for row in self.rows.values():
+            row[name] = None
+
+    def insert(self, row):
+        for column in row:
+            if column not in self.affinity:
+                raise HTTPException(status_code=500, detail=f"table has no column named {column}")
+        record = dict.fromkeys(self.columns)
+        for column, value in row.items():
+            record[column] = coerce(value, self.affinity[column])
+        rowid = record["id"]
+        if rowid is None:
+            rowid = record["id"] = self.next_id
+        elif not isinstance(rowid, int):
+            raise HTTPException(status_code=500, detail="datatype mismatch")
+        elif rowid in self.rows:
+            raise HTTPException(status_code=500, detail="UNIQUE constraint failed: id")
+        self.next_id = max(self.next_id, rowid + 1)
+        self.rows[rowid] = record
+        if not self.ids or rowid > self.ids[-1]:
+            self.ids.append(rowid)
+        else:
+            bisect.insort(self.ids, rowid)
+        return rowid
+
+    def matcher(self, filters):
+        tests = []
+        for column, op, value in filters:
+            if column not in self.affinity:
+                raise HTTPException(status_code=500, detail=f"no such column: {column}")
+            tests.append((column, COMPARE[op], rank(coerce(value, self.affinity[column]))))
+
+        def match(row):
+            for column, compare, operand in tests:
+                value = row[column]
+                if value is None or operand[0] == 0 or not compare(rank(value), operand):
+                    return False
+            return True
+        return match
+
+
+class MemoryEngine(StorageEngine):
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._forms = {}        # form path -> {table: _Table}
+        self._checkpoints = {}
+
+    def _table(self, p, table):
+        tables = self._forms.get(p)
+        if tables is None or table not in tables:
+            raise HTTPException(status_code=500, detail=f"no such table: {table}")
+        return tables[table]
+
+    # ---- forms ----
+
+    def discover(self, form_paths):
+        with self._lock:
+            return {p: {name: t.info() for name, t in tables.items()} for p, tables in self._forms.items()}
+
+    def form_exists(self, p):
+        with self._lock:
+            return p in self._forms
+
+    def create_form(self, p):
+        with self._lock:
+            self._forms.setdefault(p, {})
+        return {"db": "memory"}
+
+    def drop_form(self, p):
+        with self._lock:
+            self._forms.pop(p, None)
+            self._checkpoints.pop(p, None)
+        return {}
+
+    # ---- tables ----
+
+    def read_tables(self, p):
+        with self._lock:
+            return {name: t.info() for name, t in self._forms.get(p, {}).items()}
+
+    def read_table(self, p, table):
+        with self._lock:
+            t = self._forms.get(p, {}).get(table)
+            return t.info() if t is not None else None
+
+    def create_table(self, p, table, columns):
+        with self._lock:
+            tables = self._forms.setdefault(p, {})
+            if table not in tables:
+                tables[table] = _Table(columns)
+            return tables[table].info()
+
+    def drop_table(self, p, table):
+        with self._lock:
+            self._forms.get(p, {}).pop(table, None)
+
+    # ---- rows ----
+
+    def insert_row(self, p, table, row):
+        with self._lock:
+            return self._table(p, table).insert(row)
+
+    def bulk_insert(self, p, table, groups):
+        ranges = []
+        with self._lock:
+            t = self._table(p, table)
+            # All or nothing, like the SQL engines' single transaction
+            rows, ids, next_id = dict(t.rows), list(t.ids), t.next_id
+            try:
+                for columns, values in groups:
+                    first = last = None
+                    for value in values:
+                        rowid = t.insert(dict(zip(columns, value)))
+                        if "id" in columns:
+                            ranges.append((rowid, rowid))
+                        else:
+                            first = rowid if first is None else first
+                            last = rowid
+                    if first is not None:
+                        ranges.append((first, last))
+            except Exception:
+                t.rows, t.ids, t.next_id = rows, ids, next_id
+                raise
+        return ranges
+
+    def import_rows(self, p, table, columns, batches):
+        inserted = []
+        try:
+            # The lock is taken per batch, not while the next batch is still being uploaded
+            for batch in batches:
+                with self._lock:
+                    t = self._table(p, table)
+                    for values in batch:
+                        inserted.append(t.insert(dict(zip(columns, values))))
+        except BaseException:
+            with self._lock:
+                t = self._forms.get(p, {}).get(table)
+                if t is not None:
+                    for rowid in inserted:
+                        t.rows.pop(rowid, None)
+                    gone = set(inserted)
+                    t.ids = [i for i in t.ids if i not in gone]
+            raise
+        return len(inserted)
+
+    def update_rows(self, p, table, values, where):
+        with self._lock:
+            t = self._table(p, table)
+            for column in values:
+                if column not in t.affinity:
+                    raise HTTPException(status_code=500, detail=f"no such column: {column}")
+            match = t.matcher([(column, "=", value) for column, value in where.items()])
+            changes = {column: coerce(value, t.affinity[column]) for column, value in values.items()}
+            if "id" in changes:
+                raise HTTPException(status_code=400, detail="the memory engine cannot change row ids")
+            updated = 0
+            for row in t.rows.values():
+                if match(row):
+                    row.update(changes)
+                    updated += 1
+        return updated
+
+    def _page(self, t, filters, after_id, before_id, limit):
+        match = t.matcher(filters)
+        ascending = after_id is not None
+        # Keyset pagination: start at the cursor in the sorted ids instead of scanning from the end
+        lo = bisect.bisect_right(t.ids, after_id) if after_id is not None else 0
+        hi = bisect.bisect_left(t.ids, before_id) if before_id is not None else len(t.ids)
+        ids = range(lo, hi) if ascending else range(hi - 1, lo - 1, -1)
+        rows = []
+        for i in ids:
+            if len(rows) >= limit:
+                break
+            row = t.rows[t.ids[i]]
+            if match(row):
+                rows.append(row)
+        return rows, ascending
+
+    def list_rows(self, p, table, schema, columns, filters, after_id, before_id, limit, stream=None):
+        if columns is not None and "id" not in columns:
+            columns = ["id"] + columns
+        with self._lock:
+            t = self._table(p, table)
+            rows, ascending = self._page(t, filters, after_id, before_id, limit)
+            names = columns or t.columns
+            rows = [{c: row[c] for c in names} for row in rows]
+        if stream:
+            return stream_cursor(ListCursor(names, rows), stream, "rows", lambda completed: None)
+        return rows, ascending
+
+    def aggregate(self, p, table, schema, group_by, aggregates, filters, limit):
+        group_by = group_by or []
+        names = list(group_by)
+        for fn, column in aggregates:
+            name = f"{fn}_{column}" if column else fn
+            if name in names:
+                raise QueryError(f"duplicate result column {name!r}")
+            names.append(name)
+        with self._lock:
+            t = self._table(p, table)
+            match = t.matcher(filters)
+            groups = {}
+            if not group_by:
+                # Without GROUP BY there is always one result row, even over no rows
+                groups[()] = []
+            for row in t.rows.values():
+                if match(row):
+                    groups.setdefault(tuple(row[c] for c in group_by), []).append(row)
+        keys = sorted(groups, key=lambda k: [rank(v) for v in k])[:limit]
+        result = []
+        for key in keys:
+            out = dict(zip(group_by, key))
+            for (fn, column), name in zip(aggregates, names[len(group_by):]):
+                out[name] = self._aggregate(fn, column, groups[key])
+            result.append(out)
+        return names, result
+
+    @staticmethod
+    def _aggregate(fn, column, rows):
+        if column is None:
+            return len(rows)
+        values = [r[column] for r in rows if r[column] is not None]
+        if fn == "count":
+            return len(values)
+        if not values:
+            return None
+        if fn in ("min", "max"):
+            return (min if fn == "min" else max)(values, key=rank)
+        numbers = [v if isinstance(v, (int, float)) else (_number(str(v)) or 0) for v in values]
+        total = sum(numbers)
+        return total / len(numbers) if fn == "avg" else total
+
+    def export(self, p, table, info, fmt, compress):
+        with self._lock:
+            t = self._table(p, table)
+            columns = list(t.columns)
+            rows = [tuple(t.rows[i][c] for c in columns) for i in t.ids]
+            types = [t.types[c] for c in columns]
+        return export_response(ListCursor(columns, rows), table, fmt, compress, types, lambda completed: None)
+
+    # ---- indexes ----
+
+    def indexes(self, p, table):
+        with self._lock:
+            return [dict(ix, columns=list(ix["columns"])) for ix in self._table(p, table).indexes.values()]
+
+    def create_index(self, p, table, name, columns, unique):
+        with self._lock:
+            t = self._table(p, table)
+            for ix_table in self._forms[p].values():
+                if name in ix_table.indexes and ix_table is not t:
+                    raise HTTPException(status_code=400, detail=f"index {name} already exists")
+            if unique:
+                seen = set()
+                for row in t.rows.values():
+                    key = tuple(row[c] for c in columns)
+                    if None not in key and key in seen:
+                        raise HTTPException(status_code=400, detail="UNIQUE constraint failed")
+                    seen.add(key)
+            t.indexes.setdefault(name, {"name": name, "columns": list(columns), "unique": bool(unique)})
+
+    def drop_index(self, p, table, name):
+        with self._lock:
+            self._table(p, table).indexes.pop(name, None)
+
+    # ---- /submit ----
+
+    def add_columns(self, p, table, columns):
+        with self._lock:
+            tables = self._forms.setdefault(p, {})
+            t = tables.get(table)
+            if t is None:
+                t = tables[table] = _Table([(c, "TEXT") for c in columns])
+            for column in columns:
+                if column not in t.affinity:
+                    t.add_column(column, "TEXT")
+            return t.info()
+
+    def append_submissions(self, p, groups, checkpoint=None):
+        with self._lock:
+            t = self._table(p, SUBMISSIONS_TABLE)
+            for columns, values in groups:
+                for value in values:
+                    t.insert(dict(zip(columns, value)))
+            if checkpoint is not None:
+                self._checkpoints[p] = checkpoint
+
+    def submissions_checkpoint(self, p):
+        with self._lock:
+            return self._checkpoints.get(p, 0)
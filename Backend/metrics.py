@@ -0,0 +1,420 @@
+"""In-process Prometheus metrics for the RAAH-SETU services.
+
+A small, dependency-free registry rendered in the Prometheus text exposition
+format at ``/api/metrics``. Recording is a dict lookup plus a bisect under a
+lock, cheap enough to leave on in production.
+
+What is covered:
+
+* HTTP, via ``install_flask(app)`` / ``install_asgi(app)``: per-route latency
+  histogram, request counts by status, and requests in flight. Routes are
+  labelled with their template (``/forms/{form_name}``) so label cardinality
+  stays bounded.
+* Databases: ``observe_connect`` / ``observe_pool_wait`` are called by the
+  pools, and ``TimedConnection`` wraps a DB-API connection so every
+  ``execute`` is timed by statement type. For unbuffered cursors the time is
+  until the first result, not until the last row is read.
+* Event loop lag, via ``monitor_event_loop()`` run as a task by ASGI apps: how
+  much later than scheduled a timer fires, i.e. how long something blocked
+  the loop.
+"""
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, labels, None, value) for labels, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # per-bucket counts (last slot is +Inf), then sum and count
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._values.items()]
+        samples = []
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                samples.append((self.name + "_bucket", labels, f'le="{_format_value(bound)}"', cumulative))
+            samples.append((self.name + "_sum", labels, None, total))
+            samples.append((self.name + "_count", labels, None, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def on_collect(self, fn):
+        """Run ``fn()`` before every scrape, e.g. to copy pool stats into gauges."""
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for fn in collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Set METRICS_ENABLED=false to skip recording entirely
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency, including streamed bodies", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", ("method",))
+DB_CONNECT = REGISTRY.histogram(
+    "db_connect_duration_seconds", "Time to open a new database connection", ("backend",))
+DB_QUERY = REGISTRY.histogram(
+    "db_query_duration_seconds", "Time spent executing statements", ("backend", "operation"))
+DB_POOL_WAIT = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a free pooled connection", ("pool",))
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a sleeping timer",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+EVENT_LOOP_LAG_LAST = REGISTRY.gauge(
+    "event_loop_lag_last_seconds", "Most recent event loop lag sample")
+
+
+def render():
+    return REGISTRY.render()
+
+
+def observe_connect(backend, seconds):
+    if ENABLED:
+        DB_CONNECT.observe(seconds, backend)
+
+
+def observe_pool_wait(pool, seconds):
+    if ENABLED:
+        DB_POOL_WAIT.observe(seconds, pool)
+
+
+def register_pool(name, pool):
+    """Export ``pool.stats()`` counters as gauges, refreshed on each scrape."""
+    connections = REGISTRY.gauge("db_pool_connections", "Pooled connections by state", ("pool", "state"))
+    timeouts = REGISTRY.gauge("db_pool_timeouts", "Borrows that timed out waiting for a connection", ("pool",))
+
+    @REGISTRY.on_collect
+    def collect():
+        stats = pool.stats()
+        connections.set(stats["in_use"], name, "in_use")
+        connections.set(stats["idle"], name, "idle")
+        if "timeouts" in stats:
+            timeouts.set(stats["timeouts"], name)
+
+# ==================== DATABASE TIMING ====================
+
+_OPERATIONS = {"select", "insert", "update", "delete", "replace", "create", "drop", "alter",
+               "pragma", "show", "desc", "describe", "begin", "commit", "rollback"}
+
+
+def _operation(sql):
+    words = sql.split(None, 1) if isinstance(sql, str) else None
+    word = words[0].lower() if words else ""
+    return word if word in _OPERATIONS else "other"
+
+
+class TimedCursor:
+    """DB-API cursor proxy recording ``execute`` / ``executemany`` time."""
+
+    __slots__ = ("_cursor", "_backend")
+
+    def __init__(self, cursor, backend):
+        self._cursor = cursor
+        self._backend = backend
+
+    def _timed(self, fn, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(sql, *args, **kwargs)
+        finally:
+            DB_QUERY.observe(time.perf_counter() - started, self._backend, _operation(sql))
+
+    def execute(self, sql, *args, **kwargs):
+        return self._timed(self._cursor.execute, sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        return self._timed(self._cursor.executemany, sql, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name in TimedCursor.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+class TimedConnection:
+    """DB-API connection proxy whose cursors (and sqlite's ``conn.execute``) are timed."""
+
+    __slots__ = ("_conn", "_backend")
+
+    def __init__(self, conn, backend):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_backend", backend)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._backend)
+
+    def _timed(self, fn, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(sql, *args, **kwargs)
+        finally:
+            DB_QUERY.observe(time.perf_counter() - started, self._backend, _operation(sql))
+
+    def execute(self, sql, *args, **kwargs):
+        return self._timed(self._conn.execute, sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        return self._timed(self._conn.executemany, sql, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # e.g. sqlite's conn.row_factory
+        setattr(self._conn, name, value)
+
+
+def timed_connection(conn, backend):
+    return TimedConnection(conn, backend) if ENABLED else conn
+
+# ==================== HTTP MIDDLEWARE ====================
+
+def _record_request(method, route, status, started):
+    HTTP_LATENCY.observe(time.perf_counter() - started, method, route)
+    HTTP_REQUESTS.inc(method, route, str(status))
+    HTTP_IN_FLIGHT.dec(method)
+
+
+class _WSGIMetrics:
+    """Times a WSGI app until its response body is fully sent (or abandoned)."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        method = environ.get("REQUEST_METHOD", "GET")
+        started = time.perf_counter()
+        status = ["500"]
+        HTTP_IN_FLIGHT.inc(method)
+
+        def capture(code, headers, exc_info=None):
+            status[0] = code.split(" ", 1)[0]
+            return start_response(code, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, capture)
+        except BaseException:
+            _record_request(method, environ.get("metrics.route", UNMATCHED_ROUTE), status[0], started)
+            raise
+        return _ClosingIterator(body, lambda: _record_request(
+            method, environ.get("metrics.route", UNMATCHED_ROUTE), status[0], started))
+
+
+class _ClosingIterator:
+    def __init__(self, body, on_close):
+        self._body = body
+        self._iter = iter(body)
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iter)
+
+    def close(self):
+        try:
+            if hasattr(self._body, "close"):
+                self._body.close()
+        finally:
+            self._on_close()
+
+
+def install_flask(app, path="/api/metrics"):
+    """Instrument every route of a Flask app and serve the registry at ``path``."""
+    from flask import Response, request
+
+    @app.route(path, methods=["GET"])
+    def metrics_endpoint():
+        return Response(render(), mimetype=CONTENT_TYPE)
+
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def remember_route():
+        if request.url_rule is not None:
+            request.environ["metrics.route"] = request.url_rule.rule
+
+    app.wsgi_app = _WSGIMetrics(app.wsgi_app)
+
+
+class _ASGIMetrics:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status = [500]
+        HTTP_IN_FLIGHT.inc(method)
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            # The router stores the matched route on the scope
+            route = scope.get("route")
+            _record_request(method, getattr(route, "path", UNMATCHED_ROUTE), status[0], started)
+
+
+def install_asgi(app, path="/api/metrics"):
+    """Instrument every route of a FastAPI app and serve the registry at ``path``."""
+    from fastapi.responses import PlainTextResponse
+
+    @app.get(path, include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
+    if ENABLED:
+        app.add_middleware(_ASGIMetrics)
+
+
+async def monitor_event_loop(interval=0.25):
+    """Sample event loop lag every ``interval`` seconds until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
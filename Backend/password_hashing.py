@@ -0,0 +1,183 @@
+"""Off-thread bcrypt for the RAAH-SETU API.
+
+bcrypt is deliberately slow, so running it on the request thread lets a burst
+of logins occupy every worker. Hashes are computed in a dedicated process
+pool instead. Admission is bounded: at most ``max_pending`` jobs may be queued
+or running, and a caller that cannot get a slot within ``admit_timeout``
+seconds gets ``HashPoolBusy`` immediately so the API can answer 503. A job
+keeps its slot until the worker finishes it, and a caller whose job is not
+done within ``result_timeout`` seconds also gets ``HashPoolBusy``.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+
+class HashPoolBusy(Exception):
+    """Raised when the bcrypt pool is saturated; carries a Retry-After hint."""
+
+    def __init__(self, retry_after):
+        super().__init__("password hashing is busy, retry later")
+        self.retry_after = retry_after
+
+
+# Worker-side functions. They run in the pool processes, so they must be module
+# level and report their own start time and duration back to the caller.
+
+def _hashpw(password):
+    started = time.time()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt())
+    return hashed, started, time.time() - started
+
+
+def _checkpw(password, hashed):
+    started = time.time()
+    ok = bcrypt.checkpw(password, hashed)
+    return ok, started, time.time() - started
+
+
+class PasswordHasher:
+    def __init__(self, workers=None, max_pending=None, admit_timeout=0.05, result_timeout=10.0):
+        self.workers = workers or os.cpu_count() or 2
+        self.max_pending = max_pending or self.workers * 4
+        self.admit_timeout = admit_timeout
+        self.result_timeout = result_timeout
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._hash_total = 0.0
+        self._hash_max = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Build a hasher sized by the BCRYPT_* environment variables."""
+        workers = os.getenv("BCRYPT_WORKERS")
+        max_pending = os.getenv("BCRYPT_MAX_PENDING")
+        return cls(
+            workers=int(workers) if workers else None,
+            max_pending=int(max_pending) if max_pending else None,
+            admit_timeout=float(os.getenv("BCRYPT_ADMIT_TIMEOUT", "0.05")),
+            result_timeout=float(os.getenv("BCRYPT_RESULT_TIMEOUT", "10")),
+        )
+
+    def _pool(self):
+        # Created lazily so importing the API (or the Flask reloader parent) does
+        # not fork workers that are never used.
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _retry_after(self):
+        # Rough drain time of the current backlog, at least one second.
+        with self._stats_lock:
+            avg = self._hash_total / self._completed if self._completed else 0.25
+            backlog = self._pending
+        return max(1, int(round(backlog * avg / self.workers)))
+
+    def _admit(self, blocking=True):
+        acquired = self._slots.acquire(timeout=self.admit_timeout) if blocking else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._stats_lock:
+                self._rejected += 1
+            raise HashPoolBusy(self._retry_after())
+        with self._stats_lock:
+            self._pending += 1
+
+    def _done(self, future=None):
+        with self._stats_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _submit(self, fn, *args):
+        # The slot is held until the worker finishes, not until the caller stops waiting,
+        # so a timed-out hash still counts against max_pending while it runs
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._done()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _timed_out(self):
+        with self._stats_lock:
+            self._rejected += 1
+        return HashPoolBusy(self._retry_after())
+
+    def _record(self, submitted, started, elapsed):
+        queue_wait = max(0.0, started - submitted)
+        with self._stats_lock:
+            self._completed += 1
+            self._queue_wait_total += queue_wait
+            self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+            self._hash_total += elapsed
+            self._hash_max = max(self._hash_max, elapsed)
+
+    def _run(self, fn, *args):
+        self._admit()
+        submitted = time.time()
+        future = self._submit(fn, *args)
+        try:
+            result, started, elapsed = future.result(timeout=self.result_timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise self._timed_out()
+        self._record(submitted, started, elapsed)
+        return result
+
+    async def _run_async(self, fn, *args):
+        # Never block the event loop on admission: a full queue is rejected at once
+        self._admit(blocking=False)
+        submitted = time.time()
+        future = asyncio.wrap_future(self._submit(fn, *args))
+        try:
+            result, started, elapsed = await asyncio.wait_for(future, self.result_timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out()
+        self._record(submitted, started, elapsed)
+        return result
+
+    def hash(self, password):
+        return self._run(_hashpw, password.encode('utf-8')).decode('utf-8')
+
+    def verify(self, password, hashed):
+        return self._run(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    async def hash_async(self, password):
+        return (await self._run_async(_hashpw, password.encode('utf-8'))).decode('utf-8')
+
+    async def verify_async(self, password, hashed):
+        return await self._run_async(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        with self._stats_lock:
+            done = self._completed or 1
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "queue_wait_seconds_avg": round(self._queue_wait_total / done, 6),
+                "queue_wait_seconds_max": round(self._queue_wait_max, 6),
+                "hash_seconds_avg": round(self._hash_total / done, 6),
+                "hash_seconds_max": round(self._hash_max, 6),
+            }
@@ -0,0 +1,301 @@
+"""SOS notification fan-out for the RAAH-SETU API.
+
+``activate_sos`` commits the alert and hands it to ``SOSDispatcher.dispatch``,
+which returns immediately. A background worker then:
+
+1. loads the user's emergency contacts (highest priority first) and guardians,
+2. writes an in-app notification for every guardian and a ``sos_deliveries``
+   row for every (recipient, sender) pair,
+3. runs all deliveries concurrently on the sender pool, and
+4. records time-to-first-notification and time-to-all-notified on the alert.
+
+Fan-out is claimed in the database, so two processes (a restart overlapping
+a live run, two app instances) never both handle the same recipient. An alert
+is claimed by setting ``dispatch_started_at`` in the transaction that writes
+its delivery rows, and each delivery row moves from ``pending`` to
+``sending`` before it is sent. ``recover_pending`` picks up alerts whose
+fan-out was interrupted: an alert that was already claimed only retries the
+deliveries still ``pending``, so no recipient who was already notified gets
+the SOS twice. A delivery left ``sending`` by a crash may or may not have gone
+out and is not retried.
+
+Senders are pluggable: anything with a ``channel`` name, ``supports(recipient)``
+and ``send(recipient, alert)`` can be registered. ``LogSender`` is the local
+stub used in development and tests.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+
+
+class LogSender:
+    """Development sender: prints the notification instead of delivering it."""
+    channel = "log"
+
+    def supports(self, recipient):
+        return True
+
+    def send(self, recipient, alert):
+        print(f"[SOS {alert['sos_id']}] notify {recipient['type']} {recipient['name']} "
+              f"({recipient.get('phone') or recipient.get('email')}): user {alert['user_id']} at {alert['location']}")
+
+
+# Available senders by name; SOS_SENDERS picks which ones run (comma separated)
+SENDERS = {
+    "log": LogSender,
+}
+
+
+class SOSDispatcher:
+    def __init__(self, db_pool, senders, workers=4, delivery_workers=16, max_attempts=2):
+        self.db_pool = db_pool
+        self.senders = list(senders)
+        self.max_attempts = max_attempts
+        # Alerts are processed on one pool and their deliveries on another, so a slow
+        # sender cannot stop the next alert's recipients from being loaded.
+        self._alerts = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sos-alert")
+        self._deliveries = ThreadPoolExecutor(max_workers=delivery_workers, thread_name_prefix="sos-send")
+
+        self._lock = threading.Lock()
+        self._dispatched = 0
+        self._in_flight = 0
+        self._sent = 0
+        self._failed = 0
+        self._no_recipients = 0
+        self._first_total = 0.0
+        self._first_max = 0.0
+        self._first_count = 0
+        self._all_total = 0.0
+        self._all_max = 0.0
+        self._all_count = 0
+
+    @classmethod
+    def from_env(cls, db_pool):
+        names = [n.strip() for n in os.getenv("SOS_SENDERS", "log").split(",") if n.strip()]
+        unknown = [n for n in names if n not in SENDERS]
+        if unknown:
+            raise RuntimeError(f"unknown SOS senders: {', '.join(unknown)}")
+        return cls(
+            db_pool,
+            [SENDERS[n]() for n in names],
+            workers=int(os.getenv("SOS_WORKERS", "4")),
+            delivery_workers=int(os.getenv("SOS_DELIVERY_WORKERS", "16")),
+        )
+
+    def dispatch(self, sos_id, user_id, location, resume=False, created_at=None):
+        """Queue notification fan-out for a committed alert and return at once.
+
+        With ``resume`` the alert's delivery rows already exist and only the pending ones are sent.
+        ``created_at`` (epoch seconds) is when the alert was committed, if that was not just now.
+        """
+        durable_at = time.monotonic()
+        if created_at is not None:
+            durable_at -= max(0.0, time.time() - created_at)
+        alert = {
+            "sos_id": sos_id,
+            "user_id": user_id,
+            "location": location,
+            "durable_at": durable_at,
+            "resume": resume,
+            "recovered": created_at is not None,
+        }
+        with self._lock:
+            self._dispatched += 1
+            self._in_flight += 1
+        self._alerts.submit(self._run, alert)
+
+    def recover_pending(self):
+        """Re-dispatch active alerts whose fan-out never finished (e.g. after a crash)."""
+        with self.db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            cursor.execute(
+                "SELECT id, user_id, location, dispatch_started_at IS NOT NULL AS claimed, "
+                "UNIX_TIMESTAMP(created_at) AS created_ts "
+                "FROM sos_alerts WHERE status = 'active' AND all_notified_ms IS NULL"
+            )
+            pending = cursor.fetchall()
+        # Claimed alerts resume from their delivery rows; the rest start over (and are claimed
+        # again, so an alert another process is preparing right now is left to it)
+        for row in pending:
+            self.dispatch(row['id'], row['user_id'], row['location'], resume=bool(row['claimed']),
+                          created_at=float(row['created_ts']))
+        return len(pending)
+
+    def _load_recipients(self, cursor, user_id):
+        cursor.execute(
+            "SELECT id, name, phone, email, priority FROM emergency_contacts WHERE user_id = %s ORDER BY priority DESC, id",
+            (user_id,)
+        )
+        recipients = [dict(row, type="contact") for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT u.id, u.name, u.phone, u.email FROM guardians g JOIN users u ON u.id = g.guardian_id "
+            "WHERE g.user_id = %s ORDER BY g.id",
+            (user_id,)
+        )
+        recipients += [dict(row, type="guardian") for row in cursor.fetchall()]
+        return recipients
+
+    def _pending_jobs(self, cursor, sos_id, recipients):
+        """Claim the alert's pending deliveries; returns them as ``(delivery id, recipient, sender)`` jobs.
+
+        Also returns results failing the deliveries that can no longer be sent, because the
+        recipient was removed or the sender is no longer configured. Rows another process
+        claimed first are left out. Claims take effect when the caller commits.
+        """
+        cursor.execute(
+            "SELECT id, recipient_type, recipient_id, channel FROM sos_deliveries "
+            "WHERE sos_id = %s AND status = 'pending' ORDER BY id",
+            (sos_id,)
+        )
+        by_key = {(r["type"], r["id"]): r for r in recipients}
+        senders = {s.channel: s for s in self.senders}
+        jobs, failed = [], []
+        for row in cursor.fetchall():
+            cursor.execute("UPDATE sos_deliveries SET status = 'sending' WHERE id = %s AND status = 'pending'",
+                           (row["id"],))
+            if cursor.rowcount == 0:
+                continue
+            recipient = by_key.get((row["recipient_type"], row["recipient_id"]))
+            sender = senders.get(row["channel"])
+            if recipient is None:
+                failed.append((row["id"], False, 0, "recipient no longer exists"))
+            elif sender is None:
+                failed.append((row["id"], False, 0, f"sender {row['channel']} is not configured"))
+            else:
+                jobs.append((row["id"], recipient, sender))
+        return jobs, failed
+
+    def _resume(self, alert):
+        """Delivery jobs left pending by an interrupted run of ``alert``."""
+        with self.db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            recipients = self._load_recipients(cursor, alert["user_id"])
+            jobs, failed = self._pending_jobs(cursor, alert["sos_id"], recipients)
+            conn.commit()
+        return jobs, failed
+
+    def _prepare(self, alert):
+        """Claim the alert and persist notifications and delivery rows; returns the delivery jobs,
+        or None if another process claimed the alert first."""
+        with self.db_pool.connection() as conn, closing(conn.cursor(dictionary=True)) as cursor:
+            # Compare-and-set: a concurrent claimer waits on the row lock and then matches nothing
+            cursor.execute(
+                "UPDATE sos_alerts SET dispatch_started_at = NOW() WHERE id = %s AND dispatch_started_at IS NULL",
+                (alert["sos_id"],)
+            )
+            if cursor.rowcount == 0:
+                conn.commit()
+                return None
+            recipients = self._load_recipients(cursor, alert["user_id"])
+            guardians = [r for r in recipients if r["type"] == "guardian"]
+            if guardians:
+                cursor.executemany(
+                    "INSERT INTO notifications (user_id, title, message, created_at) VALUES (%s, %s, %s, NOW())",
+                    [(g["id"], "SOS alert", f"User {alert['user_id']} activated SOS at {alert['location'] or 'unknown location'}")
+                     for g in guardians]
+                )
+
+            jobs = [(recipient, sender) for recipient in recipients
+                    for sender in self.senders if sender.supports(recipient)]
+            if not jobs:
+                conn.commit()
+                return [], []
+            cursor.executemany(
+                "INSERT INTO sos_deliveries (sos_id, recipient_type, recipient_id, channel, address, status, created_at) "
+                "VALUES (%s, %s, %s, %s, %s, 'pending', NOW())",
+                [(alert["sos_id"], r["type"], r["id"], s.channel, r.get("phone") or r.get("email")) for r, s in jobs]
+            )
+            # Read the ids back rather than counting from lastrowid: the connector only batches
+            # plain %s VALUES lists into one INSERT, and this one has NOW()
+            jobs, failed = self._pending_jobs(cursor, alert["sos_id"], recipients)
+            conn.commit()
+        return jobs, failed
+
+    def _deliver(self, alert, recipient, sender):
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                sender.send(recipient, alert)
+                return True, attempt, None, time.monotonic()
+            except Exception as e:
+                error = str(e)[:255]
+        return False, self.max_attempts, error, time.monotonic()
+
+    def _run(self, alert):
+        try:
+            claimed = self._resume(alert) if alert["resume"] else self._prepare(alert)
+            if claimed is None:
+                return
+            jobs, results = claimed
+            if not jobs:
+                if not alert["resume"] and not results:
+                    with self._lock:
+                        self._no_recipients += 1
+                self._finish(alert, None, None, results)
+                return
+
+            futures = {self._deliveries.submit(self._deliver, alert, recipient, sender): delivery_id
+                       for delivery_id, recipient, sender in jobs}
+            first = None
+            for future in as_completed(futures):
+                ok, attempts, error, done_at = future.result()
+                if ok and first is None:
+                    first = done_at - alert["durable_at"]
+                results.append((futures[future], ok, attempts, error))
+            all_done = time.monotonic() - alert["durable_at"]
+            self._finish(alert, first, all_done, results)
+        except Exception as e:
+            print(f"SOS dispatch failed for alert {alert['sos_id']}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _finish(self, alert, first, all_done, results):
+        with self.db_pool.connection() as conn, closing(conn.cursor()) as cursor:
+            if results:
+                cursor.executemany(
+                    "UPDATE sos_deliveries SET status = %s, attempts = %s, error = %s, "
+                    "sent_at = IF(%s = 'sent', NOW(), NULL) WHERE id = %s",
+                    [("sent" if ok else "failed", attempts, error, "sent" if ok else "failed", delivery_id)
+                     for delivery_id, ok, attempts, error in results]
+                )
+            cursor.execute(
+                "UPDATE sos_alerts SET first_notified_ms = %s, all_notified_ms = %s WHERE id = %s",
+                (None if first is None else int(first * 1000), int((all_done or 0) * 1000), alert["sos_id"])
+            )
+            conn.commit()
+
+        sent = sum(1 for _, ok, _, _ in results if ok)
+        with self._lock:
+            self._sent += sent
+            self._failed += len(results) - sent
+            if alert["recovered"]:
+                # Timed from the alert's created_at across a restart; kept out of the averages
+                return
+            if first is not None:
+                self._first_count += 1
+                self._first_total += first
+                self._first_max = max(self._first_max, first)
+            if all_done is not None:
+                self._all_count += 1
+                self._all_total += all_done
+                self._all_max = max(self._all_max, all_done)
+
+    def shutdown(self, wait=True):
+        self._alerts.shutdown(wait=wait)
+        self._deliveries.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "senders": [s.channel for s in self.senders],
+                "dispatched": self._dispatched,
+                "in_flight": self._in_flight,
+                "deliveries_sent": self._sent,
+                "deliveries_failed": self._failed,
+                "alerts_without_recipients": self._no_recipients,
+                "time_to_first_seconds_avg": round(self._first_total / self._first_count, 6) if self._first_count else None,
+                "time_to_first_seconds_max": round(self._first_max, 6),
+                "time_to_all_seconds_avg": round(self._all_total / self._all_count, 6) if self._all_count else None,
+                "time_to_all_seconds_max": round(self._all_max, 6),
+            }
@@ -0,0 +1,230 @@
+"""Per-form SQLite connection cache for the form DB service (api.py).
+
+Opening a form database on every request re-reads the file header and schema
+and starts from a cold page cache. Instead, each form keeps a few open
+connections, and the forms themselves are held in a bounded LRU: when more
+than ``max_forms`` are open, the least recently used form's idle connections
+are closed.
+
+Connections are opened in WAL mode, so readers are not blocked by a writer.
+They use ``check_same_thread=False`` so any threadpool worker can borrow them,
+but a connection is only ever used by one borrower at a time.
+
+``gate(path)`` holds a form's connections off while its file is replaced
+(compaction): it waits for borrowed connections to come back, closes them all,
+and makes ``acquire`` wait until the file is in place.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from . import metrics
+
+
+class _FormConnections:
+    __slots__ = ("idle", "closed")
+
+    def __init__(self):
+        self.idle = deque()
+        self.closed = False
+
+
+class SQLiteConnectionCache:
+    def __init__(self, max_forms=64, per_form=4, synchronous="NORMAL", cache_size=-16000,
+                 mmap_size=256 * 1024 * 1024, busy_timeout=5000):
+        self.max_forms = max_forms
+        self.per_form = per_form
+        self.pragmas = (
+            "PRAGMA journal_mode = WAL",
+            f"PRAGMA synchronous = {synchronous}",
+            f"PRAGMA cache_size = {int(cache_size)}",
+            f"PRAGMA mmap_size = {int(mmap_size)}",
+            f"PRAGMA busy_timeout = {int(busy_timeout)}",
+            "PRAGMA foreign_keys = ON",
+        )
+
+        self._lock = threading.Lock()
+        # Notified when a gate opens or a connection comes back
+        self._changed = threading.Condition(self._lock)
+        self._forms = OrderedDict()
+        # id(conn) -> (path, the form entry it was borrowed from), so a handle that outlives
+        # a dropped or evicted form is closed rather than cached under a new entry
+        self._borrowed = {}
+        self._in_use = {}   # path -> borrowed connections
+        self._gated = set()
+
+        # Counters exposed through stats()
+        self._opened = 0
+        self._reused = 0
+        self._evicted = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache tuned by the SQLITE_* environment variables."""
+        return cls(
+            max_forms=int(os.getenv("SQLITE_CACHE_FORMS", "64")),
+            per_form=int(os.getenv("SQLITE_CONNS_PER_FORM", "4")),
+            synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper(),
+            cache_size=int(os.getenv("SQLITE_CACHE_SIZE", "-16000")),
+            mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+            busy_timeout=int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+        )
+
+    def _open(self, path):
+        started = time.perf_counter()
+        conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            for pragma in self.pragmas:
+                conn.execute(pragma)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        metrics.observe_connect("sqlite", time.perf_counter() - started)
+        with self._lock:
+            self._opened += 1
+        return metrics.timed_connection(conn, "sqlite")
+
+    @staticmethod
+    def _close_all(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _lend(self, path, entry, conn):
+        # Called with self._lock held
+        self._borrowed[id(conn)] = (path, entry)
+        self._in_use[path] = self._in_use.get(path, 0) + 1
+
+    def acquire(self, path):
+        """Borrow a connection to the database at ``path``, opening one if none is idle.
+
+        Waits while ``path`` is gated.
+        """
+        while True:
+            with self._lock:
+                while path in self._gated:
+                    self._changed.wait()
+                entry = self._forms.get(path)
+                if entry is not None:
+                    self._forms.move_to_end(path)
+                    conn = entry.idle.pop() if entry.idle else None
+                    if conn is not None:
+                        self._lend(path, entry, conn)
+                        self._reused += 1
+                        return conn
+
+            conn = self._open(path)
+            with self._lock:
+                gated = path in self._gated
+            if not gated:
+                break
+            # Opened on the file a gate is about to replace; wait and open the new one
+            self._close_all([conn])
+
+        evicted = []
+        with self._lock:
+            entry = self._forms.get(path)
+            if entry is None:
+                entry = self._forms[path] = _FormConnections()
+                while len(self._forms) > self.max_forms:
+                    _, old = self._forms.popitem(last=False)
+                    old.closed = True
+                    evicted.extend(old.idle)
+                    old.idle.clear()
+                    self._evicted += 1
+            self._lend(path, entry, conn)
+        self._close_all(evicted)
+        return conn
+
+    def release(self, conn, broken=False):
+        """Return a borrowed connection; it is closed if broken, evicted or surplus."""
+        if not broken:
+            try:
+                # Never hand the next borrower someone else's open transaction.
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                broken = True
+
+        with self._lock:
+            path, entry = self._borrowed.pop(id(conn))
+            self._in_use[path] -= 1
+            if not self._in_use[path]:
+                del self._in_use[path]
+            keep = not broken and not entry.closed and len(entry.idle) < self.per_form
+            if keep:
+                entry.idle.append(conn)
+            if path in self._gated:
+                self._changed.notify_all()
+        if not keep:
+            self._close_all([conn])
+
+    @contextmanager
+    def connection(self, path):
+        """Context manager yielding a cached connection; uncommitted work is rolled back on exit."""
+        conn = self.acquire(path)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self, path):
+        """Close every cached handle for ``path``; borrowed ones are closed when released."""
+        with self._lock:
+            entry = self._forms.pop(path, None)
+            if entry is None:
+                return
+            entry.closed = True
+            idle, entry.idle = list(entry.idle), deque()
+        self._close_all(idle)
+
+    @contextmanager
+    def gate(self, path, timeout=30.0):
+        """Hold off connections to ``path`` while the block runs, e.g. to swap the file.
+
+        Closes the cached handles, waits up to ``timeout`` seconds for borrowed ones to come
+        back (raising ``sqlite3.OperationalError`` if they don't) and makes ``acquire`` wait
+        until the block is done.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while path in self._gated:
+                self._changed.wait()
+            self._gated.add(path)
+        try:
+            self.close(path)
+            with self._lock:
+                while self._in_use.get(path):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise sqlite3.OperationalError(
+                            f"{self._in_use[path]} connection(s) to {path} still in use after {timeout}s")
+                    self._changed.wait(remaining)
+            yield
+        finally:
+            with self._lock:
+                self._gated.discard(path)
+                self._changed.notify_all()
+
+    def close_all(self):
+        with self._lock:
+            paths = list(self._forms)
+        for path in paths:
+            self.close(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "forms": len(self._forms),
+                "max_forms": self.max_forms,
+                "in_use": len(self._borrowed),
+                "idle": sum(len(entry.idle) for entry in self._forms.values()),
+                "opened": self._opened,
+                "reused": self._reused,
+                "evicted": self._evicted,
+            }
@@ -0,0 +1,321 @@
+"""SQLite storage engine: one database file per form (storage_engine.py).
+
+Connections come from the per-form ``SQLiteConnectionCache``; writes arrive
+already serialized per form by the writer lanes, so a bulk insert can count
+on its rowids being consecutive.
+"""
+import functools
+import os
+import sqlite3
+
+from fastapi import HTTPException
+
+from . import metrics
+from .form_catalog import TableInfo
+from .form_queries import SQLITE
+from .storage_engine import (JOURNAL_CHECKPOINT_TABLE, SUBMISSIONS_TABLE, SQLEngine, export_response,
+                             server_error, stream_cursor)
+
+quote = SQLITE.quote
+
+IMPORT_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    f"PRAGMA cache_size = {-int(os.getenv('SQLITE_IMPORT_CACHE_KIB', '262144'))}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def read_table(conn, table):
+    info = conn.execute(f"PRAGMA table_info({quote(table)})").fetchall()
+    if not info:
+        return None
+    desc = [dict(cid=r[0], name=r[1], type=r[2], notnull=r[3], dflt_value=r[4], pk=r[5]) for r in info]
+    return TableInfo([r[1] for r in info], {r[1]: r[2] for r in info}, desc)
+
+
+def read_tables(conn):
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != ?",
+        (JOURNAL_CHECKPOINT_TABLE,)).fetchall()]
+    return {name: read_table(conn, name) for name in names}
+
+
+def explicit_id_ranges(columns, values):
+    idx = columns.index("id")
+    return [(v[idx], v[idx]) for v in values]
+
+
+@functools.lru_cache(maxsize=1024)
+def submission_insert_sql(columns):
+    """INSERT for one column signature; the same text hits sqlite3's per-connection statement cache."""
+    if not columns:
+        return f"INSERT INTO {SUBMISSIONS_TABLE} DEFAULT VALUES"
+    names = ", ".join(quote(c) for c in columns)
+    return f"INSERT INTO {SUBMISSIONS_TABLE} ({names}) VALUES ({', '.join('?' for _ in columns)})"
+
+
+class SQLiteEngine(SQLEngine):
+    name = "sqlite"
+    dialect = SQLITE
+    form_suffix = ".db"
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    # ---- forms ----
+
+    def discover(self, form_paths):
+        tables = {}
+        for path in form_paths:
+            with self.cache.connection(path) as conn:
+                tables[path] = read_tables(conn)
+        return tables
+
+    def form_exists(self, p):
+        return os.path.exists(p)
+
+    def create_form(self, p):
+        # Switching the new file to WAL mode writes its header
+        with self.cache.connection(p):
+            pass
+        return {"db": p}
+
+    def drop_form(self, p):
+        # Close cached handles first; WAL mode leaves -wal/-shm files beside the database
+        self.cache.close(p)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(p + suffix):
+                os.remove(p + suffix)
+        return {}
+
+    # ---- tables ----
+
+    def read_tables(self, p):
+        with self.cache.connection(p) as conn:
+            return read_tables(conn)
+
+    def read_table(self, p, table):
+        with self.cache.connection(p) as conn:
+            return read_table(conn, table)
+
+    def create_table(self, p, table, columns):
+        sql = (f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+               + ', '.join(f"{name} {ctype}" for name, ctype in columns) + ")")
+        with self.cache.connection(p) as conn:
+            try:
+                conn.execute(sql)
+                conn.commit()
+                return read_table(conn, table)
+            except Exception as e:
+                raise server_error(e)
+
+    def drop_table(self, p, table):
+        with self.cache.connection(p) as conn:
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.commit()
+            except Exception as e:
+                raise server_error(e)
+
+    # ---- rows ----
+
+    def insert_row(self, p, table, row):
+        keys = list(row)
+        sql = f"INSERT INTO {table} ({','.join(keys)}) VALUES ({','.join('?' for _ in keys)})"
+        with self.cache.connection(p) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(sql, [row[k] for k in keys])
+                conn.commit()
+                return cur.lastrowid
+            except Exception as e:
+                raise server_error(e)
+            finally:
+                cur.close()
+
+    def bulk_insert(self, p, table, groups):
+        ranges = []
+        with self.cache.connection(p) as conn:
+            try:
+                # One transaction for every group; sqlite3 opens it at the first INSERT
+                for columns, values in groups:
+                    placeholders = ','.join('?' for _ in columns)
+                    conn.executemany(f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})", values)
+                    if "id" in columns:
+                        ranges.extend(explicit_id_ranges(columns, values))
+                    else:
+                        # We hold the write lock, so the group's rowids are consecutive
+                        last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                        ranges.append((last - len(values) + 1, last))
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                raise HTTPException(status_code=500, detail=str(e))
+        return ranges
+
+    def import_rows(self, p, table, columns, batches):
+        sql = (f"INSERT INTO {quote(table)} ({', '.join(quote(c) for c in columns)}) "
+               f"VALUES ({', '.join('?' for _ in columns)})")
+        # Import-time pragmas: no syncs inside the one big transaction, a page cache large enough
+        # to keep the table's B-tree in memory, and sort/temp space in RAM. The connection's own
+        # settings are put back before it returns to the cache.
+        restore = [pragma for pragma in self.cache.pragmas
+                   if pragma.startswith(("PRAGMA synchronous", "PRAGMA cache_size"))]
+        rows = 0
+        with self.cache.connection(p) as conn:
+            for pragma in IMPORT_PRAGMAS:
+                conn.execute(pragma)
+            try:
+                for batch in batches:
+                    conn.executemany(sql, batch)
+                    rows += len(batch)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                raise HTTPException(status_code=500, detail=str(e))
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                for pragma in restore + ["PRAGMA temp_store = DEFAULT"]:
+                    conn.execute(pragma)
+            # The commit was not synced; a checkpoint writes it into the database file
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return rows
+
+    def update_rows(self, p, table, values, where):
+        set_parts = ",".join(f"{k}=?" for k in values)
+        where_parts = " AND ".join(f"{k}=?" for k in where)
+        sql = f"UPDATE {table} SET {set_parts} WHERE {where_parts}"
+        with self.cache.connection(p) as conn:
+            try:
+                affected = conn.execute(sql, list(values.values()) + list(where.values())).rowcount
+                conn.commit()
+            except Exception as e:
+                raise server_error(e)
+        return affected
+
+    def _fetch(self, p, sql, params, mapping=False):
+        with self.cache.connection(p) as conn:
+            cur = conn.cursor()
+            if mapping:
+                cur.row_factory = sqlite3.Row
+            try:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+            except Exception as e:
+                raise server_error(e)
+            finally:
+                cur.close()
+        return [dict(r) for r in rows] if mapping else rows
+
+    def _release(self, conn, cur):
+        # Closing a sqlite cursor only resets its statement, finished or not
+        cur.close()
+        self.cache.release(conn)
+
+    def _stream(self, p, sql, params, fmt, key):
+        # The connection is held until the stream ends
+        conn = self.cache.acquire(p)
+        try:
+            cur = conn.cursor()
+            cur.row_factory = sqlite3.Row
+            cur.execute(sql, params)
+        except Exception as e:
+            self.cache.release(conn)
+            raise server_error(e)
+        return stream_cursor(cur, fmt, key, lambda completed: self._release(conn, cur))
+
+    def export(self, p, table, info, fmt, compress):
+        conn = self.cache.acquire(p)
+        try:
+            cur = conn.execute(f"SELECT * FROM {table}")
+            types = [info.types.get(d[0]) for d in cur.description]
+        except Exception as e:
+            self.cache.release(conn)
+            raise server_error(e)
+        return export_response(cur, table, fmt, compress, types, lambda completed: self._release(conn, cur))
+
+    # ---- indexes ----
+
+    def indexes(self, p, table):
+        indexes = []
+        with self.cache.connection(p) as conn:
+            for _, name, unique, origin, _ in conn.execute(f"PRAGMA index_list({quote(table)})").fetchall():
+                if origin == "pk":
+                    continue
+                columns = [r[2] for r in conn.execute(f"PRAGMA index_info({quote(name)})").fetchall()]
+                indexes.append({"name": name, "columns": columns, "unique": bool(unique)})
+        return indexes
+
+    def create_index(self, p, table, name, columns, unique):
+        sql = (f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {quote(name)} "
+               f"ON {quote(table)} ({', '.join(quote(c) for c in columns)})")
+        with self.cache.connection(p) as conn:
+            try:
+                conn.execute(sql)
+                conn.commit()
+            except sqlite3.Error as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+    def drop_index(self, p, table, name):
+        if name.startswith("sqlite_autoindex_"):
+            raise HTTPException(status_code=400, detail="index belongs to a UNIQUE constraint")
+        with self.cache.connection(p) as conn:
+            conn.execute(f"DROP INDEX {quote(name)}")
+            conn.commit()
+
+    # ---- /submit ----
+
+    def add_columns(self, p, table, columns):
+        with self.cache.connection(p) as conn:
+            info = read_table(conn, table)
+            if info is None:
+                extra = "".join(f", {quote(c)} TEXT" for c in columns)
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {quote(table)} (id INTEGER PRIMARY KEY{extra})")
+                info = read_table(conn, table)
+            for column in columns:
+                if column in info.columns:
+                    continue
+                try:
+                    conn.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} TEXT")
+                except sqlite3.OperationalError as e:
+                    # Another request added it first
+                    if "duplicate column" not in str(e):
+                        raise
+            conn.commit()
+            return read_table(conn, table)
+
+    def append_submissions(self, p, groups, checkpoint=None):
+        with self.cache.connection(p) as conn:
+            try:
+                if checkpoint is not None:
+                    conn.execute(f"CREATE TABLE IF NOT EXISTS {JOURNAL_CHECKPOINT_TABLE} "
+                                 "(id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)")
+                for columns, values in groups:
+                    conn.executemany(submission_insert_sql(columns), values)
+                if checkpoint is not None:
+                    conn.execute(f"INSERT OR REPLACE INTO {JOURNAL_CHECKPOINT_TABLE} (id, seq) VALUES (1, ?)",
+                                 (checkpoint,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def submissions_checkpoint(self, p):
+        if not os.path.exists(p):
+            return 0
+        with self.cache.connection(p) as conn:
+            try:
+                row = conn.execute(f"SELECT seq FROM {JOURNAL_CHECKPOINT_TABLE} WHERE id = 1").fetchone()
+            except sqlite3.OperationalError:
+                return 0
+        return row[0] if row else 0
+
+    # ---- lifecycle ----
+
+    def register_metrics(self):
+        metrics.register_pool("sqlite", self.cache)
+
+    def close(self):
+        self.cache.close_all()
@@ -0,0 +1,286 @@
+"""Storage engine interface for the form DB service (api.py).
+
+api.py handles HTTP, validation, the form catalog and the writer lanes, and
+hands every read and write of form data to one ``StorageEngine``, chosen at
+startup with ``STORAGE_ENGINE=sqlite|mariadb|memory``:
+
+* ``SQLiteEngine`` (sqlite_engine.py): one SQLite file per form.
+* ``MariaDBEngine`` (mariadb_engine.py): every form's tables in the one
+  MariaDB database named by MARIADB_URL.
+* ``MemoryEngine`` (memory_engine.py): plain Python structures, nothing
+  persisted; for benchmarking the HTTP layer on its own and for tests.
+
+Forms are identified by their database path (``db_path(form_name)``) even
+where no file exists, so the catalog and writer lanes work the same for every
+engine. Engines raise ``HTTPException`` for errors the client should see.
+
+The shared stream/export helpers also live here: the SQL engines stream from
+DB cursors and the memory engine from a list wrapped in ``ListCursor``.
+"""
+import json
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from . import metrics
+from .export_formats import EXPORT_FORMATS, export_stream
+from .form_queries import aggregate_query, list_rows_query
+
+# Rows fetched per round trip when streaming results
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "500"))
+STREAM_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+# Engines that keep per-form tables record the journal checkpoint here (see submit_journal.py)
+JOURNAL_CHECKPOINT_TABLE = "_submit_journal"
+SUBMISSIONS_TABLE = "submissions"
+
+EXPORT_ROWS = metrics.REGISTRY.counter(
+    "form_export_rows_total", "Rows written by table exports", ("format",))
+EXPORT_SECONDS = metrics.REGISTRY.histogram(
+    "form_export_duration_seconds", "Wall time of table exports", ("format",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0))
+
+
+def affinity(declared):
+    """SQLite's column affinity for a declared type."""
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return "INTEGER"
+    if any(t in declared for t in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if not declared or "BLOB" in declared:
+        return "BLOB"
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+class StorageEngine:
+    name = "base"
+    # form_queries.Dialect used to compile queries, None if the engine does not speak SQL
+    dialect = None
+    # True when every form shares one table namespace (the catalog then keeps one table map)
+    shared_tables = False
+    # True to run writes on the form's single writer lane (see form_executor.py)
+    serialize_writes = True
+    # Suffix of the files in the data directories that mark a form (None: forms are not files)
+    form_suffix = None
+
+    # ---- forms ----
+
+    def discover(self, form_paths):
+        """Read the tables of existing forms at startup: returns ``{scope: {table: TableInfo}}``
+        where scope is the form path, or None for shared tables."""
+        raise NotImplementedError
+
+    def form_exists(self, p):
+        """Whether form ``p`` exists in storage (asked only when the catalog misses)."""
+        raise NotImplementedError
+
+    def create_form(self, p):
+        """Create form ``p``; returns extra fields for the response."""
+        raise NotImplementedError
+
+    def drop_form(self, p):
+        """Delete form ``p`` and its data; returns extra fields for the response."""
+        raise NotImplementedError
+
+    def table_listing(self, names):
+        """show_tables payload for these table names."""
+        return names
+
+    # ---- tables ----
+
+    def read_tables(self, p):
+        """``{table: TableInfo}`` for every table of form ``p``."""
+        raise NotImplementedError
+
+    def read_table(self, p, table):
+        """TableInfo for ``table``, or None if it does not exist."""
+        raise NotImplementedError
+
+    def create_table(self, p, table, columns):
+        """Create ``table`` with an auto-increment ``id`` and ``columns`` (``[(name, type)]``); returns its TableInfo."""
+        raise NotImplementedError
+
+    def drop_table(self, p, table):
+        raise NotImplementedError
+
+    # ---- rows ----
+
+    def insert_row(self, p, table, row):
+        """Insert one row (a dict); returns its id."""
+        raise NotImplementedError
+
+    def bulk_insert(self, p, table, groups):
+        """Insert ``[(columns, [values, ...]), ...]`` in one transaction; returns ``[(first_id, last_id), ...]``."""
+        raise NotImplementedError
+
+    def import_rows(self, p, table, columns, batches):
+        """Insert every batch from the ``batches`` iterator (lists of value tuples in ``columns`` order)
+        in one transaction on the engine's bulk-load path; returns the number of rows.
+
+        Anything ``batches`` raises rolls the import back and propagates unchanged.
+        """
+        raise NotImplementedError
+
+    def update_rows(self, p, table, values, where):
+        """``UPDATE table SET values WHERE where`` (equality on every key); returns rows changed."""
+        raise NotImplementedError
+
+    def list_rows(self, p, table, schema, columns, filters, after_id, before_id, limit, stream=None):
+        """One page of rows, as ``(rows, ascending)``; or a StreamingResponse when ``stream`` is set.
+
+        Arguments are as for ``form_queries.list_rows_query``.
+        """
+        raise NotImplementedError
+
+    def aggregate(self, p, table, schema, group_by, aggregates, filters, limit):
+        """Grouped aggregates as ``(columns, rows)``; arguments as for ``form_queries.aggregate_query``."""
+        raise NotImplementedError
+
+    def export(self, p, table, info, fmt, compress):
+        """StreamingResponse with the whole table in an export format."""
+        raise NotImplementedError
+
+    # ---- indexes ----
+
+    def indexes(self, p, table):
+        """Secondary indexes as ``[{"name", "columns", "unique"}]``."""
+        raise NotImplementedError
+
+    def create_index(self, p, table, name, columns, unique):
+        raise NotImplementedError
+
+    def drop_index(self, p, table, name):
+        raise NotImplementedError
+
+    # ---- /submit ----
+
+    def add_columns(self, p, table, columns):
+        """Create ``table`` (TEXT ``columns`` plus ``id``) or add the ``columns`` it lacks; returns its TableInfo."""
+        raise NotImplementedError
+
+    def append_submissions(self, p, groups, checkpoint=None):
+        """Insert ``[(columns, [values, ...]), ...]`` into ``submissions`` in order, recording
+        ``checkpoint`` (the last journal sequence number) in the same transaction."""
+        raise NotImplementedError
+
+    def submissions_checkpoint(self, p):
+        """Last journal sequence number committed for form ``p`` (0 if none)."""
+        raise NotImplementedError
+
+    # ---- lifecycle ----
+
+    def register_metrics(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLEngine(StorageEngine):
+    """Query compilation shared by the SQL engines; they supply ``_fetch`` and ``_stream``."""
+
+    def _fetch(self, p, sql, params, mapping=False):
+        """All rows of a query, as dicts if ``mapping`` else tuples."""
+        raise NotImplementedError
+
+    def _stream(self, p, sql, params, fmt, key):
+        """StreamingResponse over a query's rows (see ``stream_cursor``)."""
+        raise NotImplementedError
+
+    def list_rows(self, p, table, schema, columns, filters, after_id, before_id, limit, stream=None):
+        sql, params, ascending = list_rows_query(
+            table, schema, self.dialect, columns=columns, filters=filters,
+            after_id=after_id, before_id=before_id, limit=limit)
+        if stream:
+            return self._stream(p, sql, params, stream, "rows")
+        return self._fetch(p, sql, params, mapping=True), ascending
+
+    def aggregate(self, p, table, schema, group_by, aggregates, filters, limit):
+        sql, params, columns = aggregate_query(
+            table, schema, self.dialect, group_by=group_by, aggregates=aggregates, filters=filters, limit=limit)
+        return columns, [dict(zip(columns, r)) for r in self._fetch(p, sql, params)]
+
+
+class ListCursor:
+    """The slice of the DB-API cursor interface the stream helpers use, over a list of rows."""
+
+    def __init__(self, columns, rows):
+        self.description = [(c, None, None, None, None, None, None) for c in columns]
+        self._rows = rows
+        self._pos = 0
+
+    def fetchmany(self, size):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def close(self):
+        self._rows = []
+
+
+def stream_cursor(cur, fmt, key, release):
+    """Stream the rows of an executed cursor without materializing them.
+
+    Rows are pulled with fetchmany(), so with a sqlite cursor or a pymysql
+    unbuffered (SS*) cursor memory stays flat however large the table is.
+    Rows must be mappings (sqlite3.Row, dict cursors). ``fmt='json'`` writes
+    ``{key: [...]}``; ``fmt='ndjson'`` writes one row per line.
+    ``release(completed)`` closes the cursor and gives the connection back once
+    the stream ends or the client goes away; ``completed`` is False if rows
+    were left unread.
+    """
+    def encode(row):
+        return json.dumps(dict(row), default=str)
+
+    def generate():
+        completed = False
+        try:
+            if fmt == "json":
+                yield f"{{{json.dumps(key)}: ["
+            first = True
+            while True:
+                rows = cur.fetchmany(STREAM_CHUNK_ROWS)
+                if not rows:
+                    break
+                if fmt == "json":
+                    chunk = ", ".join(encode(r) for r in rows)
+                    yield chunk if first else ", " + chunk
+                    first = False
+                else:
+                    yield "".join(encode(r) + "\n" for r in rows)
+            if fmt == "json":
+                yield "]}"
+            completed = True
+        finally:
+            release(completed)
+
+    return StreamingResponse(generate(), media_type=STREAM_FORMATS[fmt])
+
+
+def export_response(cur, table, fmt, compress, column_types, release):
+    """Stream an executed ``SELECT *`` as an export file; ``release(completed)`` runs when the stream
+    ends (see ``stream_cursor``)."""
+    columns = [d[0] for d in cur.description]
+
+    def done(rows, seconds, completed):
+        release(completed)
+        EXPORT_ROWS.inc(fmt, amount=rows)
+        EXPORT_SECONDS.observe(seconds, fmt)
+        rate = rows / seconds if seconds > 0 else 0.0
+        print(f"export {table} as {fmt}{'.gz' if compress else ''}: {rows} rows in {seconds:.2f}s "
+              f"({rate:.0f} rows/s){'' if completed else ', aborted'}")
+
+    headers = {"Content-Disposition": f'attachment; filename="{table}.{fmt}"'}
+    if compress == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    body = export_stream(cur, columns, fmt, STREAM_CHUNK_ROWS, column_types=column_types,
+                         compress=compress, on_done=done)
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[fmt], headers=headers)
+
+
+def server_error(e):
+    return e if isinstance(e, HTTPException) else HTTPException(status_code=500, detail=str(e))
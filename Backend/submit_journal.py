@@ -0,0 +1,330 @@
+"""Durable ingestion queue for form submissions (api.py ``/submit``).
+
+With ``SUBMIT_JOURNAL=true`` a submission is appended to a per-form
+append-only journal (one JSON line with a sequence number), fsynced, and
+acknowledged straight away. A background writer per form then drains
+everything queued so far into the form database as one transaction, so a
+burst of submissions costs one commit instead of one each, and there is only
+ever one writer per form file.
+
+The caller-supplied ``apply(form, entries)`` stores a batch together with its
+highest sequence number in the same transaction, and ``checkpoint(form)``
+reads that number back. On startup every journal is replayed from the
+checkpoint, so a crash between acknowledging and committing loses nothing and
+a crash between committing and trimming the journal inserts nothing twice.
+Once a form's queue is empty its journal is truncated.
+
+A batch that fails to commit is retried one entry at a time, so one bad
+submission cannot hold back the rest of its form. An entry that still fails
+after ``max_attempts`` tries is moved to ``<form>.dead`` (one JSON line with
+the error) and skipped. Dead-lettered sequence numbers count as used on
+startup, so they are never handed out again even when the checkpoint stops
+short of them.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from . import metrics
+
+SUFFIX = ".journal"
+DEAD_SUFFIX = ".dead"
+
+SUBMIT_COMMIT_LAG = metrics.REGISTRY.histogram(
+    "form_submit_commit_lag_seconds", "Time from accepting a journaled submission to committing it")
+SUBMIT_BATCH_ROWS = metrics.REGISTRY.histogram(
+    "form_submit_batch_rows", "Submissions committed per group commit",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+SUBMIT_APPLY_ERRORS = metrics.REGISTRY.counter(
+    "form_submit_apply_errors_total", "Group commits that failed and will be retried")
+SUBMIT_DEAD_LETTERS = metrics.REGISTRY.counter(
+    "form_submit_dead_letters_total", "Journaled submissions given up on and moved to the dead-letter file")
+
+
+class _FormQueue:
+    __slots__ = ("form", "path", "lock", "fh", "next_seq", "pending", "writing", "apply_lock",
+                 "committed", "last_commit", "isolate", "failures", "dead")
+
+    def __init__(self, form, path):
+        self.form = form
+        self.path = path
+        self.lock = threading.Lock()
+        self.fh = None
+        self.next_seq = 1
+        self.pending = deque()      # (seq, fields, accepted_at)
+        self.writing = False
+        self.apply_lock = threading.Lock()
+        self.committed = 0
+        self.last_commit = None
+        self.isolate = 0            # entries left to commit one at a time after a failed batch
+        self.failures = 0           # failed tries of the entry at the head of the queue
+        self.dead = 0
+
+
+class SubmissionJournal:
+    def __init__(self, journal_dir, apply, checkpoint, batch_rows=500, fsync=True, retry_delay=1.0,
+                 max_attempts=5):
+        self.journal_dir = journal_dir
+        self.apply = apply
+        self.checkpoint = checkpoint
+        self.batch_rows = batch_rows
+        self.fsync = fsync
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._closed = False
+        self._idle = threading.Condition(self._lock)
+        self._writers = 0
+        os.makedirs(journal_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, journal_dir, apply, checkpoint):
+        """Build a journal tuned by the SUBMIT_* environment variables."""
+        return cls(
+            os.getenv("SUBMIT_JOURNAL_DIR", journal_dir), apply, checkpoint,
+            batch_rows=int(os.getenv("SUBMIT_BATCH_ROWS", "500")),
+            fsync=os.getenv("SUBMIT_JOURNAL_FSYNC", "true").lower() in ("1", "true", "yes"),
+            max_attempts=int(os.getenv("SUBMIT_MAX_ATTEMPTS", "5")),
+        )
+
+    # ---- queues ----
+
+    def _get(self, form):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("submission journal is closed")
+            q = self._queues.get(form)
+            if q is None:
+                q = self._queues[form] = _FormQueue(form, os.path.join(self.journal_dir, form + SUFFIX))
+        with q.lock:
+            if q.fh is None:
+                self._load(q)
+        return q
+
+    def _load(self, q):
+        """Open ``q``'s journal and queue whatever the database has not committed yet.
+
+        Called with ``q.lock`` held, before the queue is used.
+        """
+        applied = self.checkpoint(q.form)
+        dead = self._dead_seqs(q.form)
+        last_seq, good_bytes = max([applied, *dead]), 0
+        if os.path.exists(q.path):
+            with open(q.path, "rb") as fh:
+                for line in fh:
+                    if not line.endswith(b"\n"):
+                        break   # torn write from a crash; never acknowledged
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    good_bytes += len(line)
+                    last_seq = max(last_seq, entry["seq"])
+                    if entry["seq"] > applied and entry["seq"] not in dead:
+                        q.pending.append((entry["seq"], entry["fields"], time.monotonic()))
+        q.fh = open(q.path, "ab")
+        if q.fh.tell() != good_bytes:
+            q.fh.truncate(good_bytes)
+        q.next_seq = last_seq + 1
+        if q.pending:
+            self._start_writer(q)
+
+    def _dead_seqs(self, form):
+        """Sequence numbers already moved to ``form``'s dead-letter file."""
+        path = os.path.join(self.journal_dir, form + DEAD_SUFFIX)
+        seqs = set()
+        if os.path.exists(path):
+            with open(path, "rb") as fh:
+                for line in fh:
+                    try:
+                        seqs.add(json.loads(line)["seq"])
+                    except (ValueError, KeyError):
+                        continue   # torn write from a crash
+        return seqs
+
+    # ---- producers ----
+
+    def submit(self, form, fields):
+        """Append one submission to ``form``'s journal and return its sequence number.
+
+        Returns once the entry is on disk (fsynced unless SUBMIT_JOURNAL_FSYNC=false).
+        """
+        q = self._get(form)
+        with q.lock:
+            seq = q.next_seq
+            q.fh.write(json.dumps({"seq": seq, "fields": fields}, default=str).encode() + b"\n")
+            q.fh.flush()
+            if self.fsync:
+                os.fsync(q.fh.fileno())
+            q.next_seq += 1
+            q.pending.append((seq, fields, time.monotonic()))
+            if not q.writing:
+                self._start_writer(q)
+        return seq
+
+    def replay(self):
+        """Queue every journal left in ``journal_dir`` (run at startup, also after close())."""
+        with self._lock:
+            self._closed = False
+        forms = [f[:-len(SUFFIX)] for f in os.listdir(self.journal_dir) if f.endswith(SUFFIX)]
+        for form in forms:
+            self._get(form)
+        return forms
+
+    # ---- writer ----
+
+    def _start_writer(self, q):
+        # Called with q.lock held
+        q.writing = True
+        with self._lock:
+            self._writers += 1
+        threading.Thread(target=self._drain, args=(q,), name=f"submit-writer-{q.form}", daemon=True).start()
+
+    def _drain(self, q):
+        try:
+            while True:
+                with q.lock:
+                    if not q.pending:
+                        # Everything in the journal is committed; start it over
+                        if not q.fh.closed:
+                            q.fh.truncate(0)
+                        q.writing = False
+                        return
+                    size = 1 if q.isolate else self.batch_rows
+                    batch = [q.pending[i] for i in range(min(size, len(q.pending)))]
+                with q.apply_lock:
+                    try:
+                        self.apply(q.form, [(seq, fields) for seq, fields, _ in batch])
+                    except Exception as e:
+                        SUBMIT_APPLY_ERRORS.inc()
+                        if self._failed(q, batch, e):
+                            continue
+                        time.sleep(self.retry_delay)
+                        continue
+                now = time.monotonic()
+                with q.lock:
+                    if q.fh.closed:
+                        # discard() dropped the form while this batch was committing
+                        q.writing = False
+                        return
+                    for _ in batch:
+                        q.pending.popleft()
+                    q.committed += len(batch)
+                    q.last_commit = time.time()
+                    q.failures = 0
+                    q.isolate = max(0, q.isolate - len(batch))
+                if metrics.ENABLED:
+                    SUBMIT_BATCH_ROWS.observe(len(batch))
+                    for _, _, accepted in batch:
+                        SUBMIT_COMMIT_LAG.observe(now - accepted)
+        finally:
+            with self._lock:
+                self._writers -= 1
+                self._idle.notify_all()
+
+    def _failed(self, q, batch, error):
+        """Note a failed commit of ``batch``; True if the writer should retry straight away.
+
+        A failed batch is retried one entry at a time to find the entry at fault; a single
+        entry that fails ``max_attempts`` times is dead-lettered. Called with ``q.apply_lock`` held.
+        """
+        if len(batch) > 1:
+            print(f"Submission journal for {q.form}: commit of {len(batch)} failed, "
+                  f"retrying one at a time: {error}")
+            with q.lock:
+                q.isolate = len(batch)
+            return True
+        seq, fields, _ = batch[0]
+        with q.lock:
+            q.failures += 1
+            if q.failures < self.max_attempts:
+                print(f"Submission journal for {q.form}: commit of seq {seq} failed "
+                      f"({q.failures}/{self.max_attempts}), retrying: {error}")
+                return False
+            if q.fh.closed:
+                return True
+            with open(os.path.join(self.journal_dir, q.form + DEAD_SUFFIX), "ab") as fh:
+                fh.write(json.dumps({"seq": seq, "fields": fields, "error": str(error)}, default=str).encode()
+                         + b"\n")
+                fh.flush()
+                os.fsync(fh.fileno())
+            q.pending.popleft()
+            q.failures = 0
+            q.isolate = max(0, q.isolate - 1)
+            q.dead += 1
+        SUBMIT_DEAD_LETTERS.inc()
+        print(f"Submission journal for {q.form}: gave up on seq {seq} after {self.max_attempts} tries, "
+              f"moved to {q.form}{DEAD_SUFFIX}: {error}")
+        return True
+
+    # ---- lifecycle ----
+
+    def discard(self, form):
+        """Forget ``form``'s queue and journal, e.g. when the form is dropped."""
+        with self._lock:
+            q = self._queues.pop(form, None)
+        if q is None:
+            if os.path.exists(os.path.join(self.journal_dir, form + SUFFIX)):
+                os.remove(os.path.join(self.journal_dir, form + SUFFIX))
+            return
+        with q.apply_lock, q.lock:
+            q.pending.clear()
+            if q.fh is not None:
+                q.fh.close()
+            if os.path.exists(q.path):
+                os.remove(q.path)
+
+    def close(self, timeout=10.0):
+        """Stop accepting submissions and wait up to ``timeout`` seconds for writers to drain.
+
+        Anything still queued stays in the journal and is replayed on the next start.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._closed = True
+            while self._writers and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            queues = list(self._queues.values())
+            self._queues.clear()
+        for q in queues:
+            with q.lock:
+                if q.fh is not None and not q.writing:
+                    q.fh.close()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            queues = list(self._queues.values())
+        forms = {}
+        for q in queues:
+            with q.lock:
+                oldest = q.pending[0][2] if q.pending else None
+                forms[q.form] = {
+                    "depth": len(q.pending),
+                    "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                    "committed": q.committed,
+                    "last_commit": q.last_commit,
+                    "dead_lettered": q.dead,
+                }
+        return {
+            "depth": sum(f["depth"] for f in forms.values()),
+            "lag_seconds": max((f["lag_seconds"] for f in forms.values()), default=0.0),
+            "forms": forms,
+        }
+
+
+def register_journal(journal):
+    """Export queue depth and the age of the oldest uncommitted submission, refreshed on each scrape."""
+    depth = metrics.REGISTRY.gauge("form_submit_queue_depth", "Journaled submissions not yet committed")
+    lag = metrics.REGISTRY.gauge(
+        "form_submit_queue_lag_seconds", "Age of the oldest journaled submission not yet committed")
+
+    @metrics.REGISTRY.on_collect
+    def collect():
+        stats = journal.stats()
+        depth.set(stats["depth"])
+        lag.set(stats["lag_seconds"])